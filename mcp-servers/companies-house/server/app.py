@@ -5,10 +5,14 @@ This module sets up the FastMCP server with tools for accessing
 UK company registration data via the Companies House API.
 """
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastmcp import FastMCP
+from starlette.middleware.gzip import GZipMiddleware
 
-from .tools import load_tools
+from .tools import close_client, load_tools, warm_client
 
 # Create the FastMCP server
 mcp_server = FastMCP(name="companies-house-mcp-server")
@@ -19,12 +23,23 @@ load_tools(mcp_server)
 # Convert to HTTP application
 mcp_app = mcp_server.http_app()
 
-# Create FastAPI instance for additional endpoints
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run the MCP lifespan, warming the shared HTTP client first and closing it after."""
+    await warm_client()
+    async with mcp_app.lifespan(app):
+        yield
+    await close_client()
+
+
+# Create the FastAPI application serving the MCP app and additional endpoints
 app = FastAPI(
     title="Companies House MCP Server",
     description="MCP Server for UK company registration data",
     version="0.1.0",
-    lifespan=mcp_app.lifespan,
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
 
@@ -41,12 +56,9 @@ async def root():
     }
 
 
-# Combined application with MCP and custom routes
-combined_app = FastAPI(
-    title="Companies House MCP Server",
-    routes=[
-        *mcp_app.routes,
-        *app.routes,
-    ],
-    lifespan=mcp_app.lifespan,
-)
+# Compress larger responses, including those from the mounted MCP app. MCP event
+# streams are left uncompressed so events are not buffered (starlette>=0.46.0)
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
+# Mount the MCP app last so the custom routes above take precedence
+app.mount("/", mcp_app)
@@ -13,12 +13,26 @@ def main():
     parser.add_argument(
         "--port", type=int, default=8000, help="Port to run the server on (default: 8000)"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help=(
+            "Number of worker processes (default: 1). MCP sessions are held in one "
+            "process's memory, so more than one worker breaks sessions"
+        ),
+    )
     args = parser.parse_args()
 
     uvicorn.run(
-        "server.app:combined_app",
+        "server.app:app",
         host="0.0.0.0",
         port=args.port,
+        workers=args.workers,
+        loop="uvloop",
+        http="httptools",
+        log_level="warning",
+        access_log=False,
     )
 
 
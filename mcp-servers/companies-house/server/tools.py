@@ -5,23 +5,120 @@ This module defines the MCP tools for accessing UK company registration data
 via the Companies House API.
 """
 
+import asyncio
 import base64
 import os
 
-import requests
+import httpx
+import orjson
+from cachetools import TTLCache
 
 TIMEOUT = 30
+# Largest page size the Companies House API accepts
+MAX_ITEMS_PER_PAGE = 100
 BASE_URL = "https://api.company-information.service.gov.uk"
 
+# API paths relative to BASE_URL; the client's base_url supplies the host
+_SEARCH_PATH = "/search/companies"
+_PROFILE_PATH = "/company/{}"
+_OFFICERS_PATH = "/company/{}/officers"
+_FILING_PATH = "/company/{}/filing-history"
+
 
 def _get_auth_header() -> str | None:
-    """Get the Basic auth header for Companies House API."""
+    """Build the Basic auth header for Companies House API from the environment."""
     api_key = os.environ.get("COMPANIES_HOUSE_API_KEY")
     if not api_key:
         return None
     return "Basic " + base64.b64encode((api_key + ":").encode("utf-8")).decode("utf-8")
 
 
+# The API key is fixed for the lifetime of the process, so the header is
+# built once at import and attached to every request by the shared client.
+_AUTH_HEADER = _get_auth_header()
+
+# Shared async client so concurrent tool calls multiplex over pooled HTTP/2
+# connections without blocking the event loop.
+_CLIENT = httpx.AsyncClient(
+    base_url=BASE_URL,
+    headers={"Authorization": _AUTH_HEADER} if _AUTH_HEADER else None,
+    timeout=httpx.Timeout(TIMEOUT),
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+        retries=3,
+    ),
+)
+
+# Response caches keyed by (path, params). TTLs follow how often each
+# resource changes upstream and keep us well inside the API rate limit.
+_SEARCH_CACHE: TTLCache = TTLCache(maxsize=10_000, ttl=300)
+_PROFILE_CACHE: TTLCache = TTLCache(maxsize=10_000, ttl=86400)
+_OFFICERS_CACHE: TTLCache = TTLCache(maxsize=10_000, ttl=3600)
+_FILING_CACHE: TTLCache = TTLCache(maxsize=10_000, ttl=3600)
+
+
+async def warm_client(connections: int = 5) -> None:
+    """
+    Open pooled connections to the API ahead of the first tool call.
+
+    Failures are ignored; the pool will fill on demand instead.
+
+    Args:
+        connections: Number of concurrent HEAD requests to issue.
+    """
+    await asyncio.gather(
+        *(_CLIENT.head("/", timeout=5) for _ in range(connections)),
+        return_exceptions=True,
+    )
+
+
+async def close_client() -> None:
+    """Close the shared HTTP client and release pooled connections."""
+    await _CLIENT.aclose()
+
+
+async def _http_get(path: str, params: dict | None = None, cache: TTLCache | None = None) -> dict:
+    """
+    GET a Companies House API path and return the decoded JSON body.
+
+    Successful responses are stored in ``cache`` (when given) keyed by path and
+    params. Failures are returned as an error dict rather than raised.
+
+    Args:
+        path: API path relative to BASE_URL (e.g., "/company/14307029").
+        params: Optional query parameters.
+        cache: Optional TTL cache to read from and populate.
+
+    Returns:
+        dict: The API response, or an error dict on failure.
+    """
+    if not _AUTH_HEADER:
+        return {"error": "COMPANIES_HOUSE_API_KEY environment variable not set"}
+
+    key = (path, tuple(sorted(params.items())) if params else ())
+    if cache is not None:
+        try:
+            return cache[key]
+        except KeyError:
+            pass
+
+    try:
+        response = await _CLIENT.get(path, params=params)
+        response.raise_for_status()
+        data = orjson.loads(response.content)
+    except httpx.TimeoutException:
+        return {"error": f"Request timed out after {TIMEOUT} seconds"}
+    except httpx.HTTPStatusError as e:
+        return {"error": f"HTTP {e.response.status_code}", "message": e.response.text}
+    except Exception as e:
+        return {"error": "Request failed", "message": str(e)}
+
+    if cache is not None:
+        cache[key] = data
+    return data
+
+
 def load_tools(mcp_server):
     """
     Register all Companies House MCP tools with the server.
@@ -38,15 +135,14 @@ def load_tools(mcp_server):
         Returns:
             dict: Health status information.
         """
-        api_key = os.environ.get("COMPANIES_HOUSE_API_KEY")
         return {
             "status": "healthy",
             "message": "Companies House MCP Server is running.",
-            "api_key_configured": bool(api_key),
+            "api_key_configured": bool(_AUTH_HEADER),
         }
 
     @mcp_server.tool
-    def search_companies(
+    async def search_companies(
         query: str,
         items_per_page: int = 10,
         start_index: int = 0,
@@ -65,31 +161,15 @@ def load_tools(mcp_server):
         Example:
             search_companies("Databricks", items_per_page=5)
         """
-        auth_header = _get_auth_header()
-        if not auth_header:
-            return {"error": "COMPANIES_HOUSE_API_KEY environment variable not set"}
-
-        url = f"{BASE_URL}/search/companies"
         params = {
             "q": query,
-            "items_per_page": str(items_per_page),
+            "items_per_page": str(min(items_per_page, MAX_ITEMS_PER_PAGE)),
             "start_index": str(start_index),
         }
-        headers = {"Authorization": auth_header}
-
-        try:
-            response = requests.get(url, params=params, headers=headers, timeout=TIMEOUT)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.Timeout:
-            return {"error": f"Request timed out after {TIMEOUT} seconds"}
-        except requests.exceptions.HTTPError:
-            return {"error": f"HTTP {response.status_code}", "message": response.text}
-        except Exception as e:
-            return {"error": "Request failed", "message": str(e)}
+        return await _http_get(_SEARCH_PATH, params, cache=_SEARCH_CACHE)
 
     @mcp_server.tool
-    def get_company_profile(company_number: str) -> dict:
+    async def get_company_profile(company_number: str) -> dict:
         """
         Get detailed profile information for a specific company.
 
@@ -103,26 +183,10 @@ def load_tools(mcp_server):
         Example:
             get_company_profile("14307029")
         """
-        auth_header = _get_auth_header()
-        if not auth_header:
-            return {"error": "COMPANIES_HOUSE_API_KEY environment variable not set"}
-
-        url = f"{BASE_URL}/company/{company_number}"
-        headers = {"Authorization": auth_header}
-
-        try:
-            response = requests.get(url, headers=headers, timeout=TIMEOUT)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.Timeout:
-            return {"error": f"Request timed out after {TIMEOUT} seconds"}
-        except requests.exceptions.HTTPError:
-            return {"error": f"HTTP {response.status_code}", "message": response.text}
-        except Exception as e:
-            return {"error": "Request failed", "message": str(e)}
+        return await _http_get(_PROFILE_PATH.format(company_number), cache=_PROFILE_CACHE)
 
     @mcp_server.tool
-    def get_company_officers(
+    async def get_company_officers(
         company_number: str,
         items_per_page: int = 35,
         start_index: int = 0,
@@ -132,7 +196,7 @@ def load_tools(mcp_server):
 
         Args:
             company_number: The UK company registration number.
-            items_per_page: Number of results per page (default: 35).
+            items_per_page: Number of results per page (default: 35, max: 100).
             start_index: Starting index for pagination (default: 0).
 
         Returns:
@@ -141,30 +205,14 @@ def load_tools(mcp_server):
         Example:
             get_company_officers("14307029")
         """
-        auth_header = _get_auth_header()
-        if not auth_header:
-            return {"error": "COMPANIES_HOUSE_API_KEY environment variable not set"}
-
-        url = f"{BASE_URL}/company/{company_number}/officers"
         params = {
-            "items_per_page": str(items_per_page),
+            "items_per_page": str(min(items_per_page, MAX_ITEMS_PER_PAGE)),
             "start_index": str(start_index),
         }
-        headers = {"Authorization": auth_header}
-
-        try:
-            response = requests.get(url, params=params, headers=headers, timeout=TIMEOUT)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.Timeout:
-            return {"error": f"Request timed out after {TIMEOUT} seconds"}
-        except requests.exceptions.HTTPError:
-            return {"error": f"HTTP {response.status_code}", "message": response.text}
-        except Exception as e:
-            return {"error": "Request failed", "message": str(e)}
+        return await _http_get(_OFFICERS_PATH.format(company_number), params, cache=_OFFICERS_CACHE)
 
     @mcp_server.tool
-    def get_filing_history(
+    async def get_filing_history(
         company_number: str,
         items_per_page: int = 25,
         start_index: int = 0,
@@ -174,7 +222,7 @@ def load_tools(mcp_server):
 
         Args:
             company_number: The UK company registration number.
-            items_per_page: Number of results per page (default: 25).
+            items_per_page: Number of results per page (default: 25, max: 100).
             start_index: Starting index for pagination (default: 0).
 
         Returns:
@@ -183,24 +231,8 @@ def load_tools(mcp_server):
         Example:
             get_filing_history("14307029", items_per_page=10)
         """
-        auth_header = _get_auth_header()
-        if not auth_header:
-            return {"error": "COMPANIES_HOUSE_API_KEY environment variable not set"}
-
-        url = f"{BASE_URL}/company/{company_number}/filing-history"
         params = {
-            "items_per_page": str(items_per_page),
+            "items_per_page": str(min(items_per_page, MAX_ITEMS_PER_PAGE)),
             "start_index": str(start_index),
         }
-        headers = {"Authorization": auth_header}
-
-        try:
-            response = requests.get(url, params=params, headers=headers, timeout=TIMEOUT)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.Timeout:
-            return {"error": f"Request timed out after {TIMEOUT} seconds"}
-        except requests.exceptions.HTTPError:
-            return {"error": f"HTTP {response.status_code}", "message": response.text}
-        except Exception as e:
-            return {"error": "Request failed", "message": str(e)}
+        return await _http_get(_FILING_PATH.format(company_number), params, cache=_FILING_CACHE)
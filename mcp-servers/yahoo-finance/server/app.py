@@ -5,8 +5,13 @@ This module sets up the FastMCP server with tools for accessing
 stock market data via the yfinance library.
 """
 
+from contextlib import asynccontextmanager
+
+import anyio
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastmcp import FastMCP
+from starlette.middleware.gzip import GZipMiddleware
 
 from .tools import load_tools
 
@@ -19,12 +24,26 @@ load_tools(mcp_server)
 # Convert to HTTP application
 mcp_app = mcp_server.http_app()
 
-# Create FastAPI instance for additional endpoints
+# Blocking yfinance calls run on anyio worker threads; raise the default
+# limit of 40 so slow fetches do not queue behind each other.
+THREAD_LIMIT = 64
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Raise the worker thread limit and run the MCP lifespan."""
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREAD_LIMIT
+    async with mcp_app.lifespan(app):
+        yield
+
+
+# Create the FastAPI application serving the MCP app and additional endpoints
 app = FastAPI(
     title="Yahoo Finance MCP Server",
     description="MCP Server for stock market data via yfinance",
     version="0.1.0",
-    lifespan=mcp_app.lifespan,
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
 
@@ -42,12 +61,9 @@ async def root():
     }
 
 
-# Combined application with MCP and custom routes
-combined_app = FastAPI(
-    title="Yahoo Finance MCP Server",
-    routes=[
-        *mcp_app.routes,
-        *app.routes,
-    ],
-    lifespan=mcp_app.lifespan,
-)
+# Compress larger responses, including those from the mounted MCP app. MCP event
+# streams are left uncompressed so events are not buffered (starlette>=0.46.0)
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
+# Mount the MCP app last so the custom routes above take precedence
+app.mount("/", mcp_app)
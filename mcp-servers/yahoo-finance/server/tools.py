@@ -5,7 +5,160 @@ This module defines the MCP tools for accessing stock market data
 using the yfinance library. No API key is required.
 """
 
+import asyncio
+import functools
+import threading
+import time
+from operator import attrgetter
+
+import anyio
 import yfinance as yf
+from cachetools import TTLCache, cached
+
+# Upper bound on rows returned per symbol by the history tools, to keep
+# responses for long periods at fine intervals to a manageable size
+MAX_HISTORY_ROWS = 50_000
+
+# Ticker objects are reused so repeated calls share yfinance's session and
+# crumb. yfinance memoizes some properties on the Ticker itself, so entries
+# expire after a minute to keep those values from going stale.
+_TICKERS: TTLCache = TTLCache(maxsize=1024, ttl=60)
+_TICKERS_LOCK = threading.Lock()
+
+# Stock info is served stale-while-revalidate: entries younger than
+# _INFO_FRESH_SECONDS are returned as-is, older ones up to _INFO_STALE_SECONDS
+# are returned immediately while a background refresh runs, and anything
+# older is fetched before returning. Entries are (fetched_at, info) tuples.
+# The cache is only touched from the event loop thread; fetches run on worker
+# threads and hand their result back to be stored.
+_INFO_FRESH_SECONDS = 30
+_INFO_STALE_SECONDS = 300
+_INFO_CACHE: TTLCache = TTLCache(maxsize=1024, ttl=_INFO_STALE_SECONDS)
+# Per-symbol locks for in-flight fetches, removed once the fetch completes
+_INFO_LOCKS: dict[str, asyncio.Lock] = {}
+_REFRESHING: set[str] = set()
+_BACKGROUND_TASKS: set[asyncio.Task] = set()
+
+# Per-endpoint result caches, with TTLs matched to how volatile the data is.
+_HISTORY_CACHE: TTLCache = TTLCache(maxsize=1024, ttl=300)
+_FINANCIALS_CACHE: TTLCache = TTLCache(maxsize=1024, ttl=86400)
+_RECOMMENDATIONS_CACHE: TTLCache = TTLCache(maxsize=1024, ttl=3600)
+_DIVIDENDS_CACHE: TTLCache = TTLCache(maxsize=1024, ttl=86400)
+_CACHE_LOCK = threading.Lock()
+
+
+def _get_ticker(symbol: str, refresh: bool = False) -> yf.Ticker:
+    """
+    Return a shared Ticker for the symbol, creating it on first use.
+
+    With ``refresh=True`` the cached Ticker is replaced so properties that
+    yfinance memoizes on the instance are fetched again.
+    """
+    with _TICKERS_LOCK:
+        ticker = None if refresh else _TICKERS.get(symbol)
+        if ticker is None:
+            ticker = _TICKERS[symbol] = yf.Ticker(symbol)
+        return ticker
+
+
+def _load_info(symbol: str) -> dict:
+    return _get_ticker(symbol, refresh=True).info
+
+
+async def _refresh_info(symbol: str) -> dict:
+    """Fetch stock info on a worker thread so the event loop is not blocked."""
+    try:
+        info = await anyio.to_thread.run_sync(_load_info, symbol)
+        _INFO_CACHE[symbol] = (time.monotonic(), info)
+        return info
+    finally:
+        _REFRESHING.discard(symbol)
+
+
+def _on_refresh_done(task: asyncio.Task) -> None:
+    _BACKGROUND_TASKS.discard(task)
+    if not task.cancelled():
+        # A failed background refresh leaves the stale entry in place
+        task.exception()
+
+
+async def _get_info(symbol: str) -> dict:
+    """Return stock info for the symbol using stale-while-revalidate caching."""
+    entry = _INFO_CACHE.get(symbol)
+    if entry is not None:
+        fetched_at, info = entry
+        if time.monotonic() - fetched_at < _INFO_FRESH_SECONDS:
+            return info
+        if symbol not in _REFRESHING:
+            _REFRESHING.add(symbol)
+            task = asyncio.create_task(_refresh_info(symbol))
+            _BACKGROUND_TASKS.add(task)
+            task.add_done_callback(_on_refresh_done)
+        return info
+
+    # Nothing usable cached; a per-symbol lock stops concurrent callers from
+    # all fetching the same symbol at once.
+    lock = _INFO_LOCKS.setdefault(symbol, asyncio.Lock())
+    async with lock:
+        entry = _INFO_CACHE.get(symbol)
+        if entry is not None:
+            return entry[1]
+        _REFRESHING.add(symbol)
+        try:
+            return await _refresh_info(symbol)
+        finally:
+            # Callers already waiting on this lock find the new cache entry
+            _INFO_LOCKS.pop(symbol, None)
+
+
+@cached(_HISTORY_CACHE, lock=_CACHE_LOCK)
+def _fetch_history(symbol: str, period: str, interval: str):
+    return _get_ticker(symbol).history(period=period, interval=interval)
+
+
+# Ticker accessors for each supported get_financials statement_type
+_STATEMENTS = {
+    "income": attrgetter("financials"),
+    "balance": attrgetter("balance_sheet"),
+    "cashflow": attrgetter("cashflow"),
+}
+
+
+@cached(_FINANCIALS_CACHE, lock=_CACHE_LOCK)
+def _fetch_statement(symbol: str, statement_type: str):
+    return _STATEMENTS[statement_type](_get_ticker(symbol))
+
+
+@cached(_RECOMMENDATIONS_CACHE, lock=_CACHE_LOCK)
+def _fetch_recommendations(symbol: str):
+    return _get_ticker(symbol).recommendations
+
+
+@cached(_DIVIDENDS_CACHE, lock=_CACHE_LOCK)
+def _fetch_dividends(symbol: str):
+    return _get_ticker(symbol).dividends
+
+
+def _history_to_columns(hist) -> dict:
+    """
+    Convert a price history DataFrame to columnar JSON-serializable lists.
+
+    The index column is "Date" for daily intervals and "Datetime" for intraday
+    ones, so it is located by position rather than by name. Histories longer
+    than MAX_HISTORY_ROWS keep only the most recent rows and are flagged as
+    truncated.
+    """
+    truncated = len(hist) > MAX_HISTORY_ROWS
+    if truncated:
+        hist = hist.tail(MAX_HISTORY_ROWS)
+    hist = hist.reset_index()
+    date_column = hist.columns[0]
+    hist[date_column] = hist[date_column].dt.strftime("%Y-%m-%dT%H:%M:%S%z")
+    return {
+        "columns": list(hist.columns),
+        "data": hist.to_dict(orient="list"),
+        "truncated": truncated,
+    }
 
 
 def load_tools(mcp_server):
@@ -31,7 +184,7 @@ def load_tools(mcp_server):
         }
 
     @mcp_server.tool
-    def get_stock_info(symbol: str) -> dict:
+    async def get_stock_info(symbol: str) -> dict:
         """
         Get comprehensive stock information from Yahoo Finance.
 
@@ -46,8 +199,7 @@ def load_tools(mcp_server):
             get_stock_info("AAPL")
         """
         try:
-            ticker = yf.Ticker(symbol)
-            info = ticker.info
+            info = await _get_info(symbol)
 
             if not info or info.get("regularMarketPrice") is None:
                 return {"error": f"No data found for symbol: {symbol}"}
@@ -57,7 +209,7 @@ def load_tools(mcp_server):
             return {"error": "Request failed", "message": str(e)}
 
     @mcp_server.tool
-    def get_stock_history(
+    async def get_stock_history(
         symbol: str,
         period: str,
         interval: str,
@@ -72,34 +224,89 @@ def load_tools(mcp_server):
                 1h, 1d, 5d, 1wk, 1mo, 3mo.
 
         Returns:
-            dict: Historical price data with dates and OHLCV values.
+            dict: Historical price data with dates and OHLCV values, as one list
+                  per column under "data". At most 50,000 of the most recent rows
+                  are returned; "truncated" is true when older rows were dropped.
 
         Example:
             get_stock_history("MSFT", "1mo", "1d")
         """
         try:
-            ticker = yf.Ticker(symbol)
-            hist = ticker.history(period=period, interval=interval)
+            hist = await anyio.to_thread.run_sync(_fetch_history, symbol, period, interval)
 
             if hist.empty:
                 return {"error": f"No historical data found for symbol: {symbol}"}
 
-            # Convert to JSON-serializable format
-            hist = hist.reset_index()
-            hist["Date"] = hist["Date"].astype(str)
-            records = hist.to_dict(orient="records")
-
             return {
                 "symbol": symbol,
                 "period": period,
                 "interval": interval,
-                "data": records,
+                **_history_to_columns(hist),
+            }
+        except Exception as e:
+            return {"error": "Request failed", "message": str(e)}
+
+    @mcp_server.tool
+    async def get_stock_history_batch(
+        symbols: list[str],
+        period: str,
+        interval: str,
+    ) -> dict:
+        """
+        Get historical OHLCV data for several stocks in a single batched download.
+
+        Args:
+            symbols: Stock ticker symbols (e.g., ["AAPL", "MSFT", "GOOGL"]).
+            period: Data period - valid values: 1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, 10y, ytd, max.
+            interval: Data interval - valid values: 1m, 2m, 5m, 15m, 30m, 60m, 90m,
+                1h, 1d, 5d, 1wk, 1mo, 3mo.
+
+        Returns:
+            dict: Historical price data keyed by symbol, each in the same columnar
+                  format (and with the same row cap) as get_stock_history.
+
+        Example:
+            get_stock_history_batch(["AAPL", "MSFT"], "1mo", "1d")
+        """
+        try:
+            download = functools.partial(
+                yf.download,
+                tickers=symbols,
+                period=period,
+                interval=interval,
+                group_by="ticker",
+                threads=True,
+                progress=False,
+            )
+            data = await anyio.to_thread.run_sync(download)
+
+            results = {}
+            for symbol in symbols:
+                if data is None or data.empty:
+                    hist = None
+                elif data.columns.nlevels > 1:
+                    hist = data[symbol] if symbol in data.columns.get_level_values(0) else None
+                else:
+                    hist = data
+                if hist is not None:
+                    hist = hist.dropna(how="all")
+
+                if hist is None or hist.empty:
+                    results[symbol] = {"error": f"No historical data found for symbol: {symbol}"}
+                else:
+                    results[symbol] = _history_to_columns(hist)
+
+            return {
+                "symbols": symbols,
+                "period": period,
+                "interval": interval,
+                "data": results,
             }
         except Exception as e:
             return {"error": "Request failed", "message": str(e)}
 
     @mcp_server.tool
-    def get_financials(symbol: str, statement_type: str) -> dict:
+    async def get_financials(symbol: str, statement_type: str) -> dict:
         """
         Get financial statements for a company.
 
@@ -114,26 +321,19 @@ def load_tools(mcp_server):
             get_financials("GOOGL", "income")
         """
         try:
-            ticker = yf.Ticker(symbol)
-
-            if statement_type == "income":
-                df = ticker.financials
-            elif statement_type == "balance":
-                df = ticker.balance_sheet
-            elif statement_type == "cashflow":
-                df = ticker.cashflow
-            else:
+            if statement_type not in _STATEMENTS:
                 return {
                     "error": f"Invalid statement_type: {statement_type}. "
                     "Use 'income', 'balance', or 'cashflow'"
                 }
 
+            df = await anyio.to_thread.run_sync(_fetch_statement, symbol, statement_type)
+
             if df is None or df.empty:
                 return {"error": f"No financial data found for symbol: {symbol}"}
 
-            # Convert to JSON-serializable format
-            df.columns = df.columns.astype(str)
-            result = df.to_dict()
+            # Convert to JSON-serializable format (copy, as df is shared via the cache)
+            result = df.set_axis(df.columns.astype(str), axis=1).to_dict()
 
             return {
                 "symbol": symbol,
@@ -144,7 +344,7 @@ def load_tools(mcp_server):
             return {"error": "Request failed", "message": str(e)}
 
     @mcp_server.tool
-    def get_recommendations(symbol: str) -> dict:
+    async def get_recommendations(symbol: str) -> dict:
         """
         Get analyst recommendations and ratings for a stock.
 
@@ -158,8 +358,7 @@ def load_tools(mcp_server):
             get_recommendations("NVDA")
         """
         try:
-            ticker = yf.Ticker(symbol)
-            recommendations = ticker.recommendations
+            recommendations = await anyio.to_thread.run_sync(_fetch_recommendations, symbol)
 
             if recommendations is None or recommendations.empty:
                 return {"error": f"No recommendations found for symbol: {symbol}"}
@@ -179,7 +378,7 @@ def load_tools(mcp_server):
             return {"error": "Request failed", "message": str(e)}
 
     @mcp_server.tool
-    def get_dividends(symbol: str) -> dict:
+    async def get_dividends(symbol: str) -> dict:
         """
         Get dividend payment history for a stock.
 
@@ -187,26 +386,24 @@ def load_tools(mcp_server):
             symbol: Stock ticker symbol (e.g., "JNJ", "KO").
 
         Returns:
-            dict: Dividend payment history with dates and amounts.
+            dict: Dividend payment history, with "date" and "dividend" lists.
 
         Example:
             get_dividends("JNJ")
         """
         try:
-            ticker = yf.Ticker(symbol)
-            dividends = ticker.dividends
+            dividends = await anyio.to_thread.run_sync(_fetch_dividends, symbol)
 
             if dividends is None or dividends.empty:
                 return {"error": f"No dividend data found for symbol: {symbol}"}
 
-            # Convert to list of records
-            records = [
-                {"date": str(date), "dividend": float(value)} for date, value in dividends.items()
-            ]
+            # Convert to columnar format with vectorized date formatting
+            df = dividends.rename_axis("date").reset_index(name="dividend")
+            df["date"] = df["date"].dt.strftime("%Y-%m-%d")
 
             return {
                 "symbol": symbol,
-                "dividends": records,
+                "dividends": df.to_dict(orient="list"),
             }
         except Exception as e:
             return {"error": "Request failed", "message": str(e)}
@@ -9,17 +9,14 @@
 
 # COMMAND ----------
 
-import requests
+from databricks.sdk import WorkspaceClient
+from databricks.sdk.errors import ResourceAlreadyExists
 
 # COMMAND ----------
 
-# DBTITLE 1,Get workspace context
-workspace_url: str = (
-    dbutils.notebook.entry_point.getDbutils().notebook().getContext().apiUrl().get()
-)
-pat: str = (
-    dbutils.notebook.entry_point.getDbutils().notebook().getContext().apiToken().get()
-)
+# DBTITLE 1,Get workspace client
+# Authenticates with the notebook's own credentials
+w: WorkspaceClient = WorkspaceClient()
 
 # COMMAND ----------
 
@@ -32,40 +29,22 @@ print(f"Using api_key: {api_key[:8]}..." if len(api_key) > 8 else "API key set")
 # COMMAND ----------
 
 # DBTITLE 1,Create secret scope
-url: str = f"{workspace_url}/api/2.0/secrets/scopes/create"
-headers: dict[str, str] = {
-    "Authorization": f"Bearer {pat}",
-    "Content-Type": "application/json",
-}
-data: dict[str, str] = {"scope": "companies_house"}
-response: requests.Response = requests.post(url, headers=headers, json=data)
-
-if response.status_code == 400 and "RESOURCE_ALREADY_EXISTS" in response.text:
+scope_name: str = "companies_house"
+
+try:
+    w.secrets.create_scope(scope=scope_name)
+    print(f"Created scope {scope_name}")
+except ResourceAlreadyExists:
     print("Scope already exists, continue")
-elif response.status_code != 200:
-    raise Exception(f"Failed to create scope: {response.status_code} {response.text}")
-else:
-    print(response.status_code, response.text)
 
 # COMMAND ----------
 
 # DBTITLE 1,Store API key in secrets
-scope_name: str = "companies_house"
 key_name: str = "api_key"
 api_key: str = dbutils.widgets.get("api_key")
 
-url: str = f"{workspace_url}/api/2.0/secrets/put"
-headers: dict[str, str] = {
-    "Authorization": f"Bearer {pat}",
-    "Content-Type": "application/json",
-}
-data: dict[str, str] = {"scope": scope_name, "key": key_name, "string_value": api_key}
-response: requests.Response = requests.post(url, headers=headers, json=data)
-
-if response.status_code != 200:
-    raise Exception(f"Failed to store secret: {response.status_code} {response.text}")
-else:
-    print("Secret stored successfully.")
+w.secrets.put_secret(scope=scope_name, key=key_name, string_value=api_key)
+print("Secret stored successfully.")
 
 # COMMAND ----------
 
@@ -89,6 +68,13 @@ print(f"Using schema: {schema}")
 
 # COMMAND ----------
 
+# DBTITLE 1,Create run mode widget
+# "interactive" displays test results; "job" runs the tests without rendering them
+dbutils.widgets.dropdown("run_mode", "interactive", ["interactive", "job"], "Run Mode")
+run_mode: str = dbutils.widgets.get("run_mode")
+
+# COMMAND ----------
+
 # DBTITLE 1,Create companies_house schema
 # MAGIC %sql
 # MAGIC -- Create the companies_house schema
@@ -102,197 +88,437 @@ print(f"Using schema: {schema}")
 
 # COMMAND ----------
 
-# DBTITLE 1,Create Python function for searching companies
+# DBTITLE 1,Create API response cache table
 # MAGIC %sql
-# MAGIC CREATE OR REPLACE FUNCTION search_companies_inner(
-# MAGIC   search_query STRING,
-# MAGIC   api_key STRING,
-# MAGIC   items_per_page INT ,
-# MAGIC   start_index INT
+# MAGIC -- Create Delta table caching Companies House responses, filled by the refresh cell below
+# MAGIC CREATE TABLE IF NOT EXISTS api_cache (
+# MAGIC   key STRING COMMENT 'endpoint/company_number[/items_per_page/start_index]',
+# MAGIC   endpoint STRING,
+# MAGIC   company_number STRING,
+# MAGIC   items_per_page INT,
+# MAGIC   start_index INT,
+# MAGIC   body STRING,
+# MAGIC   fetched_at TIMESTAMP
 # MAGIC )
-# MAGIC RETURNS STRING
-# MAGIC LANGUAGE PYTHON
-# MAGIC COMMENT 'Search for companies using Companies House API'
-# MAGIC AS $$
-# MAGIC import requests
-# MAGIC import base64
-# MAGIC
-# MAGIC TIMEOUT = 30
-# MAGIC
-# MAGIC # Construct Basic auth header
-# MAGIC auth_header = "Basic " + base64.b64encode((api_key + ":").encode("utf-8")).decode("utf-8")
-# MAGIC
-# MAGIC # Make API request
-# MAGIC url = "https://api.company-information.service.gov.uk/search/companies"
-# MAGIC params = {
-# MAGIC     "q": search_query,
-# MAGIC     "items_per_page": str(items_per_page),
-# MAGIC     "start_index": str(start_index)
-# MAGIC }
-# MAGIC headers = {
-# MAGIC     "Authorization": auth_header
-# MAGIC }
-# MAGIC
-# MAGIC try:
-# MAGIC     response = requests.get(url, params=params, headers=headers, timeout=TIMEOUT)
-# MAGIC     response.raise_for_status()
-# MAGIC     return response.text
-# MAGIC except requests.exceptions.Timeout:
-# MAGIC     return f'{{"error": "Request timed out after {TIMEOUT} seconds"}}'
-# MAGIC except requests.exceptions.HTTPError:
-# MAGIC     return f'{{"error": "HTTP {response.status_code}", "message": "{response.text}"}}'
-# MAGIC except Exception as e:
-# MAGIC     return f'{{"error": "Request failed", "message": "{str(e)}"}}'
-# MAGIC $$;
+# MAGIC COMMENT 'Cached Companies House API responses';
 # MAGIC
-
 # COMMAND ----------
 
-# DBTITLE 1,Create outer function for searching companies
+# DBTITLE 1,Create cache lookup function
 query: str = f"""
-CREATE OR REPLACE FUNCTION {catalog_name}.{schema}.search_companies(
-    query STRING COMMENT 'Search query',
-    items_per_page INT DEFAULT 10 COMMENT 'Number of items per page (Default: 10)',
-    start_index INT DEFAULT 0 COMMENT 'Start index (Default: 0)'
+CREATE OR REPLACE FUNCTION {catalog_name}.{schema}.ch_cache_lookup(
+    cache_key STRING COMMENT 'Cache key',
+    ttl_seconds INT COMMENT 'Maximum age of a cached response in seconds'
 )
 RETURNS STRING
-COMMENT 'Search companies using Companies House API'
+COMMENT 'Return a cached Companies House response no older than ttl_seconds, or NULL'
 RETURN
-    SELECT {catalog_name}.{schema}.search_companies_inner(
-        query,
-        secret('companies_house', 'api_key'),
-        items_per_page,
-        start_index
-    );
+    SELECT max_by(body, fetched_at)
+    FROM {catalog_name}.{schema}.api_cache
+    WHERE key = cache_key
+      AND fetched_at > current_timestamp() - make_dt_interval(0, 0, 0, ttl_seconds);
 """
 
 spark.sql(query)
 
 # COMMAND ----------
 
-# DBTITLE 1,Test search companies
+# DBTITLE 1,Create shared inner function for Companies House requests
 # MAGIC %sql
-# MAGIC -- Test search_companies function and parse JSON response
-# MAGIC SELECT
-# MAGIC   from_json(
-# MAGIC     search_companies('Databricks'),
-# MAGIC     'STRUCT<items:ARRAY<STRUCT<company_number:STRING, title:STRING, company_status:STRING, date_of_creation:STRING, address_snippet:STRING>>, total_results:INT>'
-# MAGIC   ) as result
-
-# COMMAND ----------
-
-# DBTITLE 1,Create inner function to get company profile
-# MAGIC %sql
-# MAGIC -- Create inner Python function to get company profile
-# MAGIC CREATE OR REPLACE FUNCTION get_company_profile_inner(
+# MAGIC CREATE OR REPLACE FUNCTION ch_request_inner(
+# MAGIC   endpoint STRING,
 # MAGIC   company_number STRING,
-# MAGIC   api_key STRING
+# MAGIC   api_key STRING,
+# MAGIC   items_per_page INT,
+# MAGIC   start_index INT,
+# MAGIC   cached_body STRING
 # MAGIC )
 # MAGIC RETURNS STRING
 # MAGIC LANGUAGE PYTHON
-# MAGIC COMMENT 'Inner function to get detailed company profile from Companies House API'
+# MAGIC PARAMETER STYLE PANDAS
+# MAGIC HANDLER 'handler'
+# MAGIC ENVIRONMENT (
+# MAGIC   dependencies = '["httpx[http2]", "cachetools"]',
+# MAGIC   environment_version = 'None'
+# MAGIC )
+# MAGIC COMMENT 'Inner function for Companies House API requests. endpoint is one of search, profile, officers or filings; company_number holds the search query for search. A non-NULL cached_body is returned without a request'
 # MAGIC AS $$
-# MAGIC import requests
+# MAGIC import asyncio
 # MAGIC import base64
+# MAGIC import json
+# MAGIC import os
+# MAGIC import time
+# MAGIC from typing import Iterator, Tuple
 # MAGIC
-# MAGIC TIMEOUT = 30
-# MAGIC
-# MAGIC # Construct Basic auth header
-# MAGIC auth_header = "Basic " + base64.b64encode((api_key + ":").encode("utf-8")).decode("utf-8")
+# MAGIC import httpx
+# MAGIC import pandas as pd
+# MAGIC from cachetools import LRUCache, TLRUCache
 # MAGIC
-# MAGIC # Make API request
-# MAGIC url = f"https://api.company-information.service.gov.uk/company/{company_number}"
-# MAGIC headers = {
-# MAGIC     "Authorization": auth_header
+# MAGIC TIMEOUT = 30
+# MAGIC MAX_CONCURRENCY = 64
+# MAGIC KEEPALIVE_EXPIRY = 60
+# MAGIC MAX_RETRIES = 5
+# MAGIC BACKOFF_FACTOR = 0.2
+# MAGIC RETRY_STATUSES = {429, 500, 502, 503, 504}
+# MAGIC # Companies House allows 600 requests per 5 minutes per API key
+# MAGIC RATE_LIMIT = 2.0
+# MAGIC RATE_BURST = 10
+# MAGIC BASE_URL = "https://api.company-information.service.gov.uk"
+# MAGIC # Ask for compressed JSON; filing histories and officer lists are large
+# MAGIC HEADERS = {
+# MAGIC     "Accept-Encoding": "gzip, deflate",
+# MAGIC     "User-Agent": "databricks-reference-data",
+# MAGIC }
+# MAGIC ENDPOINTS = {
+# MAGIC     "search": "/search/companies",
+# MAGIC     "profile": "/company/{company_number}",
+# MAGIC     "officers": "/company/{company_number}/officers",
+# MAGIC     "filings": "/company/{company_number}/filing-history",
+# MAGIC }
+# MAGIC CACHE_TTLS = {
+# MAGIC     "search": 300,
+# MAGIC     "profile": 86400,
+# MAGIC     "officers": 3600,
+# MAGIC     "filings": 3600,
 # MAGIC }
 # MAGIC
-# MAGIC try:
-# MAGIC     response = requests.get(url, headers=headers, timeout=TIMEOUT)
-# MAGIC     response.raise_for_status()
-# MAGIC     return response.text
-# MAGIC except requests.exceptions.Timeout:
-# MAGIC     return f'{{"error": "Request timed out after {TIMEOUT} seconds"}}'
-# MAGIC except requests.exceptions.HTTPError:
-# MAGIC     return f'{{"error": "HTTP {response.status_code}", "message": "{response.text}"}}'
-# MAGIC except Exception as e:
-# MAGIC     return f'{{"error": "Request failed", "message": "{str(e)}"}}'
+# MAGIC # One event loop and HTTP/2 client live for the lifetime of this Python worker,
+# MAGIC # so pooled connections are reused across batches and shared by every endpoint.
+# MAGIC # Requests within a batch are multiplexed over those connections, bounded by
+# MAGIC # MAX_CONCURRENCY. Idle connections are kept for KEEPALIVE_EXPIRY seconds (httpx
+# MAGIC # defaults to 5) so gaps between batches don't force a new TLS handshake.
+# MAGIC loop = asyncio.new_event_loop()
+# MAGIC client = httpx.AsyncClient(
+# MAGIC     base_url=BASE_URL,
+# MAGIC     headers=HEADERS,
+# MAGIC     timeout=TIMEOUT,
+# MAGIC     transport=httpx.AsyncHTTPTransport(
+# MAGIC         http2=True,
+# MAGIC         limits=httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=KEEPALIVE_EXPIRY),
+# MAGIC         retries=3,
+# MAGIC     ),
+# MAGIC )
+# MAGIC semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+# MAGIC
+# MAGIC
+# MAGIC class TokenBucket:
+# MAGIC     # Paces requests to stay under the API rate limit instead of relying on 429 retries
+# MAGIC     def __init__(self, rate, burst):
+# MAGIC         self.rate = rate
+# MAGIC         self.burst = burst
+# MAGIC         self.tokens = burst
+# MAGIC         self.updated = time.monotonic()
+# MAGIC         self.lock = asyncio.Lock()
+# MAGIC
+# MAGIC     async def acquire(self):
+# MAGIC         async with self.lock:
+# MAGIC             while True:
+# MAGIC                 now = time.monotonic()
+# MAGIC                 self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+# MAGIC                 self.updated = now
+# MAGIC                 if self.tokens >= 1:
+# MAGIC                     self.tokens -= 1
+# MAGIC                     return
+# MAGIC                 await asyncio.sleep((1 - self.tokens) / self.rate)
+# MAGIC
+# MAGIC
+# MAGIC bucket = TokenBucket(RATE_LIMIT, RATE_BURST)
+# MAGIC
+# MAGIC # Successful responses keyed by (endpoint, url, params) and expired per endpoint,
+# MAGIC # so repeated rows skip the network. Set the CLEAR_CACHE environment variable to
+# MAGIC # drop cached responses.
+# MAGIC cache = TLRUCache(maxsize=100_000, ttu=lambda key, value, now: now + CACHE_TTLS[key[0]])
+# MAGIC
+# MAGIC # Request headers carrying the encoded Basic auth, keyed by API key
+# MAGIC auth_headers = {}
+# MAGIC
+# MAGIC # ETag and body of past responses, kept after they expire from the cache so a
+# MAGIC # repeat request can be revalidated with If-None-Match and a bodiless 304
+# MAGIC etags = LRUCache(maxsize=100_000)
+# MAGIC
+# MAGIC
+# MAGIC async def get(url, params, headers):
+# MAGIC     # Retry rate limited (429) and transient server errors with exponential backoff,
+# MAGIC     # honouring Retry-After. Connection errors are retried by the transport.
+# MAGIC     for attempt in range(MAX_RETRIES + 1):
+# MAGIC         await bucket.acquire()
+# MAGIC         async with semaphore:
+# MAGIC             response = await client.get(url, params=params, headers=headers)
+# MAGIC         if response.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+# MAGIC             return response
+# MAGIC         retry_after = response.headers.get("Retry-After", "")
+# MAGIC         await asyncio.sleep(float(retry_after) if retry_after.isdigit() else BACKOFF_FACTOR * 2**attempt)
+# MAGIC
+# MAGIC
+# MAGIC async def fetch(endpoint, company_number, api_key, items_per_page, start_index, cached_body):
+# MAGIC     # Fresh responses from the api_cache table are passed in by the outer functions
+# MAGIC     if isinstance(cached_body, str):
+# MAGIC         return cached_body
+# MAGIC
+# MAGIC     try:
+# MAGIC         if endpoint not in ENDPOINTS:
+# MAGIC             return json.dumps({"error": "Unknown endpoint", "message": endpoint})
+# MAGIC
+# MAGIC         url = ENDPOINTS[endpoint].format(company_number=company_number)
+# MAGIC         params = {}
+# MAGIC         if endpoint == "search":
+# MAGIC             params["q"] = company_number
+# MAGIC         if not pd.isna(items_per_page):
+# MAGIC             params["items_per_page"] = str(int(items_per_page))
+# MAGIC         if not pd.isna(start_index):
+# MAGIC             params["start_index"] = str(int(start_index))
+# MAGIC         key = (endpoint, url, tuple(sorted(params.items())))
+# MAGIC         if key in cache:
+# MAGIC             return cache[key]
+# MAGIC
+# MAGIC         # Construct Basic auth headers once per API key
+# MAGIC         headers = auth_headers.get(api_key)
+# MAGIC         if headers is None:
+# MAGIC             headers = {
+# MAGIC                 "Authorization": "Basic " + base64.b64encode((api_key + ":").encode("utf-8")).decode("utf-8")
+# MAGIC             }
+# MAGIC             auth_headers[api_key] = headers
+# MAGIC
+# MAGIC         # Make API request, conditional on the last ETag if there is one
+# MAGIC         validator = etags.get(key)
+# MAGIC         if validator is not None:
+# MAGIC             headers = {**headers, "If-None-Match": validator[0]}
+# MAGIC         response = await get(url, params, headers)
+# MAGIC         if response.status_code == 304 and validator is not None:
+# MAGIC             cache[key] = validator[1]
+# MAGIC             return validator[1]
+# MAGIC         if response.status_code >= 400:
+# MAGIC             return json.dumps({"error": f"HTTP {response.status_code}", "message": response.text})
+# MAGIC         if "ETag" in response.headers:
+# MAGIC             etags[key] = (response.headers["ETag"], response.text)
+# MAGIC         cache[key] = response.text
+# MAGIC         return response.text
+# MAGIC     except httpx.TimeoutException:
+# MAGIC         return json.dumps({"error": f"Request timed out after {TIMEOUT} seconds"})
+# MAGIC     except Exception as e:
+# MAGIC         return json.dumps({"error": "Request failed", "message": str(e)})
+# MAGIC
+# MAGIC
+# MAGIC async def fetch_batch(*columns):
+# MAGIC     # Duplicate rows within a batch share a single request
+# MAGIC     rows = list(zip(*columns))
+# MAGIC     unique = list(dict.fromkeys(rows))
+# MAGIC     results = dict(zip(unique, await asyncio.gather(*(fetch(*row) for row in unique))))
+# MAGIC     return [results[row] for row in rows]
+# MAGIC
+# MAGIC
+# MAGIC def handler(
+# MAGIC     batch_iter: Iterator[Tuple[pd.Series, pd.Series, pd.Series, pd.Series, pd.Series, pd.Series]],
+# MAGIC ) -> Iterator[pd.Series]:
+# MAGIC     for endpoints, numbers, api_keys, pages, starts, cached_bodies in batch_iter:
+# MAGIC         if os.environ.get("CLEAR_CACHE"):
+# MAGIC             cache.clear()
+# MAGIC         yield pd.Series(
+# MAGIC             loop.run_until_complete(fetch_batch(endpoints, numbers, api_keys, pages, starts, cached_bodies))
+# MAGIC         )
 # MAGIC $$;
+# MAGIC
 
 # COMMAND ----------
 
-# DBTITLE 1,Create outer function to get company profile
-query: str = f"""
-CREATE OR REPLACE FUNCTION {catalog_name}.{schema}.get_company_profile(
-    company_number STRING COMMENT 'Company number'
-)
-RETURNS STRING
-COMMENT 'Get detailed company profile from Companies House API'
-RETURN
-    {catalog_name}.{schema}.get_company_profile_inner(
-        company_number,
-        secret('companies_house', 'api_key')
-    );
-"""
-
-spark.sql(query)
-
-# COMMAND ----------
-
-# DBTITLE 1,Test Company Profile
-result_df = spark.sql(
-    f"SELECT {catalog_name}.{schema}.get_company_profile('14307029') AS company_profile"
-)
-display(result_df)
-
-# COMMAND ----------
-
-# DBTITLE 1,Create inner function to get company officers
+# DBTITLE 1,Create inner table function to fetch all pages
 # MAGIC %sql
-# MAGIC -- Create inner Python function to get company officers
-# MAGIC CREATE OR REPLACE FUNCTION get_company_officers_inner(
+# MAGIC -- Create inner Python table function that fetches every page of a paginated endpoint
+# MAGIC CREATE OR REPLACE FUNCTION ch_paginate_inner(
+# MAGIC   endpoint STRING,
 # MAGIC   company_number STRING,
-# MAGIC   api_key STRING,
-# MAGIC   items_per_page INT,
-# MAGIC   start_index INT
+# MAGIC   api_key STRING
 # MAGIC )
-# MAGIC RETURNS STRING
+# MAGIC RETURNS TABLE (item STRING)
 # MAGIC LANGUAGE PYTHON
-# MAGIC COMMENT 'Inner function to get list of company officers from Companies House API'
+# MAGIC HANDLER 'Paginate'
+# MAGIC ENVIRONMENT (
+# MAGIC   dependencies = '["httpx[http2]", "orjson"]',
+# MAGIC   environment_version = 'None'
+# MAGIC )
+# MAGIC COMMENT 'Inner function to fetch all pages of company officers or filing history from Companies House API'
 # MAGIC AS $$
-# MAGIC import requests
+# MAGIC import asyncio
 # MAGIC import base64
+# MAGIC import time
 # MAGIC
-# MAGIC TIMEOUT = 30
-# MAGIC
-# MAGIC # Construct Basic auth header
-# MAGIC auth_header = "Basic " + base64.b64encode((api_key + ":").encode("utf-8")).decode("utf-8")
+# MAGIC import httpx
+# MAGIC import orjson
 # MAGIC
-# MAGIC # Make API request
-# MAGIC url = f"https://api.company-information.service.gov.uk/company/{company_number}/officers"
-# MAGIC params = {
-# MAGIC     "items_per_page": str(items_per_page),
-# MAGIC     "start_index": str(start_index)
+# MAGIC TIMEOUT = 30
+# MAGIC MAX_CONCURRENCY = 64
+# MAGIC KEEPALIVE_EXPIRY = 60
+# MAGIC MAX_RETRIES = 5
+# MAGIC BACKOFF_FACTOR = 0.2
+# MAGIC RETRY_STATUSES = {429, 500, 502, 503, 504}
+# MAGIC # Companies House allows 600 requests per 5 minutes per API key
+# MAGIC RATE_LIMIT = 2.0
+# MAGIC RATE_BURST = 10
+# MAGIC PAGE_SIZE = 100
+# MAGIC BASE_URL = "https://api.company-information.service.gov.uk"
+# MAGIC # Ask for compressed JSON; filing histories and officer lists are large
+# MAGIC HEADERS = {
+# MAGIC     "Accept-Encoding": "gzip, deflate",
+# MAGIC     "User-Agent": "databricks-reference-data",
 # MAGIC }
-# MAGIC headers = {
-# MAGIC     "Authorization": auth_header
+# MAGIC # Path and the response field holding the total number of items
+# MAGIC ENDPOINTS = {
+# MAGIC     "officers": ("/company/{company_number}/officers", "total_results"),
+# MAGIC     "filings": ("/company/{company_number}/filing-history", "total_count"),
 # MAGIC }
 # MAGIC
-# MAGIC try:
-# MAGIC     response = requests.get(url, params=params, headers=headers, timeout=TIMEOUT)
+# MAGIC loop = asyncio.new_event_loop()
+# MAGIC client = httpx.AsyncClient(
+# MAGIC     base_url=BASE_URL,
+# MAGIC     headers=HEADERS,
+# MAGIC     timeout=TIMEOUT,
+# MAGIC     transport=httpx.AsyncHTTPTransport(
+# MAGIC         http2=True,
+# MAGIC         limits=httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=KEEPALIVE_EXPIRY),
+# MAGIC         retries=3,
+# MAGIC     ),
+# MAGIC )
+# MAGIC semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+# MAGIC
+# MAGIC
+# MAGIC class TokenBucket:
+# MAGIC     # Paces requests to stay under the API rate limit instead of relying on 429 retries
+# MAGIC     def __init__(self, rate, burst):
+# MAGIC         self.rate = rate
+# MAGIC         self.burst = burst
+# MAGIC         self.tokens = burst
+# MAGIC         self.updated = time.monotonic()
+# MAGIC         self.lock = asyncio.Lock()
+# MAGIC
+# MAGIC     async def acquire(self):
+# MAGIC         async with self.lock:
+# MAGIC             while True:
+# MAGIC                 now = time.monotonic()
+# MAGIC                 self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+# MAGIC                 self.updated = now
+# MAGIC                 if self.tokens >= 1:
+# MAGIC                     self.tokens -= 1
+# MAGIC                     return
+# MAGIC                 await asyncio.sleep((1 - self.tokens) / self.rate)
+# MAGIC
+# MAGIC
+# MAGIC bucket = TokenBucket(RATE_LIMIT, RATE_BURST)
+# MAGIC
+# MAGIC
+# MAGIC async def get(url, params, headers):
+# MAGIC     # Retry rate limited (429) and transient server errors with exponential backoff,
+# MAGIC     # honouring Retry-After. Connection errors are retried by the transport.
+# MAGIC     for attempt in range(MAX_RETRIES + 1):
+# MAGIC         await bucket.acquire()
+# MAGIC         async with semaphore:
+# MAGIC             response = await client.get(url, params=params, headers=headers)
+# MAGIC         if response.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+# MAGIC             return response
+# MAGIC         retry_after = response.headers.get("Retry-After", "")
+# MAGIC         await asyncio.sleep(float(retry_after) if retry_after.isdigit() else BACKOFF_FACTOR * 2**attempt)
+# MAGIC
+# MAGIC
+# MAGIC async def fetch_page(url, headers, start_index):
+# MAGIC     params = {
+# MAGIC         "items_per_page": str(PAGE_SIZE),
+# MAGIC         "start_index": str(start_index)
+# MAGIC     }
+# MAGIC     response = await get(url, params, headers)
 # MAGIC     response.raise_for_status()
-# MAGIC     return response.text
-# MAGIC except requests.exceptions.Timeout:
-# MAGIC     return f'{{"error": "Request timed out after {TIMEOUT} seconds"}}'
-# MAGIC except requests.exceptions.HTTPError:
-# MAGIC     return f'{{"error": "HTTP {response.status_code}", "message": "{response.text}"}}'
-# MAGIC except Exception as e:
-# MAGIC     return f'{{"error": "Request failed", "message": "{str(e)}"}}'
+# MAGIC     return orjson.loads(response.content)
+# MAGIC
+# MAGIC
+# MAGIC async def fetch_all(url, total_field, headers):
+# MAGIC     # Probe the first page for the total, then fetch the remaining pages concurrently
+# MAGIC     first = await fetch_page(url, headers, 0)
+# MAGIC     total = first.get(total_field, 0)
+# MAGIC     rest = await asyncio.gather(
+# MAGIC         *(fetch_page(url, headers, start_index) for start_index in range(PAGE_SIZE, total, PAGE_SIZE))
+# MAGIC     )
+# MAGIC     return [first, *rest]
+# MAGIC
+# MAGIC
+# MAGIC def error(error, message=None):
+# MAGIC     body = {"error": error} if message is None else {"error": error, "message": message}
+# MAGIC     return orjson.dumps(body).decode("utf-8")
+# MAGIC
+# MAGIC
+# MAGIC class Paginate:
+# MAGIC     def eval(self, endpoint, company_number, api_key):
+# MAGIC         if endpoint not in ENDPOINTS:
+# MAGIC             yield (error("Unknown endpoint", endpoint),)
+# MAGIC             return
+# MAGIC
+# MAGIC         path, total_field = ENDPOINTS[endpoint]
+# MAGIC         headers = {
+# MAGIC             "Authorization": "Basic " + base64.b64encode((api_key + ":").encode("utf-8")).decode("utf-8")
+# MAGIC         }
+# MAGIC
+# MAGIC         try:
+# MAGIC             pages = loop.run_until_complete(
+# MAGIC                 fetch_all(path.format(company_number=company_number), total_field, headers)
+# MAGIC             )
+# MAGIC         except httpx.TimeoutException:
+# MAGIC             yield (error(f"Request timed out after {TIMEOUT} seconds"),)
+# MAGIC             return
+# MAGIC         except httpx.HTTPStatusError as e:
+# MAGIC             yield (error(f"HTTP {e.response.status_code}", e.response.text),)
+# MAGIC             return
+# MAGIC         except Exception as e:
+# MAGIC             yield (error("Request failed", str(e)),)
+# MAGIC             return
+# MAGIC
+# MAGIC         for page in pages:
+# MAGIC             for item in page.get("items", []):
+# MAGIC                 yield (orjson.dumps(item).decode("utf-8"),)
 # MAGIC $$;
+# MAGIC
 
 # COMMAND ----------
 
-# DBTITLE 1,Create outer function to get company officers
-query: str = f"""
+# DBTITLE 1,Create outer functions
+from concurrent.futures import ThreadPoolExecutor
+
+# SQL wrappers that supply the API key and default values. Parameter markers are not
+# allowed in persisted function bodies, so the catalog and schema are formatted in.
+ddls: list[str] = [
+    f"""
+CREATE OR REPLACE FUNCTION {catalog_name}.{schema}.search_companies(
+    query STRING COMMENT 'Search query',
+    items_per_page INT DEFAULT 10 COMMENT 'Number of items per page (Default: 10)',
+    start_index INT DEFAULT 0 COMMENT 'Start index (Default: 0)'
+)
+RETURNS STRING
+COMMENT 'Search companies using Companies House API'
+RETURN
+    {catalog_name}.{schema}.ch_request_inner(
+        'search',
+        query,
+        (SELECT secret('companies_house', 'api_key')),
+        items_per_page,
+        start_index,
+        {catalog_name}.{schema}.ch_cache_lookup(
+            concat_ws('/', 'search', query, items_per_page, start_index), 300
+        )
+    );
+""",
+    f"""
+CREATE OR REPLACE FUNCTION {catalog_name}.{schema}.get_company_profile(
+    company_number STRING COMMENT 'Company number'
+)
+RETURNS STRING
+COMMENT 'Get detailed company profile from Companies House API'
+RETURN
+    {catalog_name}.{schema}.ch_request_inner(
+        'profile',
+        company_number,
+        (SELECT secret('companies_house', 'api_key')),
+        CAST(NULL AS INT),
+        CAST(NULL AS INT),
+        {catalog_name}.{schema}.ch_cache_lookup(concat_ws('/', 'profile', company_number), 86400)
+    );
+""",
+    f"""
 CREATE OR REPLACE FUNCTION {catalog_name}.{schema}.get_company_officers(
     company_number STRING COMMENT 'Company number',
     items_per_page INT DEFAULT 35 COMMENT 'Number of items per page (Default: 35)',
@@ -301,65 +527,18 @@ CREATE OR REPLACE FUNCTION {catalog_name}.{schema}.get_company_officers(
 RETURNS STRING
 COMMENT 'Get list of company officers from Companies House API'
 RETURN
-    {catalog_name}.{schema}.get_company_officers_inner(
+    {catalog_name}.{schema}.ch_request_inner(
+        'officers',
         company_number,
-        secret('companies_house', 'api_key'),
+        (SELECT secret('companies_house', 'api_key')),
         items_per_page,
-        start_index
+        start_index,
+        {catalog_name}.{schema}.ch_cache_lookup(
+            concat_ws('/', 'officers', company_number, items_per_page, start_index), 3600
+        )
     );
-"""
-
-spark.sql(query)
-
-# COMMAND ----------
-
-# DBTITLE 1,Create inner function to get filing history
-# MAGIC %sql
-# MAGIC -- Create inner Python function to get filing history
-# MAGIC CREATE OR REPLACE FUNCTION get_filing_history_inner(
-# MAGIC   company_number STRING,
-# MAGIC   api_key STRING,
-# MAGIC   items_per_page INT,
-# MAGIC   start_index INT
-# MAGIC )
-# MAGIC RETURNS STRING
-# MAGIC LANGUAGE PYTHON
-# MAGIC COMMENT 'Inner function to get company filing history from Companies House API'
-# MAGIC AS $$
-# MAGIC import requests
-# MAGIC import base64
-# MAGIC
-# MAGIC TIMEOUT = 30
-# MAGIC
-# MAGIC # Construct Basic auth header
-# MAGIC auth_header = "Basic " + base64.b64encode((api_key + ":").encode("utf-8")).decode("utf-8")
-# MAGIC
-# MAGIC # Make API request
-# MAGIC url = f"https://api.company-information.service.gov.uk/company/{company_number}/filing-history"
-# MAGIC params = {
-# MAGIC     "items_per_page": str(items_per_page),
-# MAGIC     "start_index": str(start_index)
-# MAGIC }
-# MAGIC headers = {
-# MAGIC     "Authorization": auth_header
-# MAGIC }
-# MAGIC
-# MAGIC try:
-# MAGIC     response = requests.get(url, params=params, headers=headers, timeout=TIMEOUT)
-# MAGIC     response.raise_for_status()
-# MAGIC     return response.text
-# MAGIC except requests.exceptions.Timeout:
-# MAGIC     return f'{{"error": "Request timed out after {TIMEOUT} seconds"}}'
-# MAGIC except requests.exceptions.HTTPError:
-# MAGIC     return f'{{"error": "HTTP {response.status_code}", "message": "{response.text}"}}'
-# MAGIC except Exception as e:
-# MAGIC     return f'{{"error": "Request failed", "message": "{str(e)}"}}'
-# MAGIC $$;
-
-# COMMAND ----------
-
-# DBTITLE 1,Create outer function to get filing history
-query: str = f"""
+""",
+    f"""
 CREATE OR REPLACE FUNCTION {catalog_name}.{schema}.get_filing_history(
     company_number STRING COMMENT 'Company number',
     items_per_page INT DEFAULT 25 COMMENT 'Number of items per page (Default: 25)',
@@ -368,31 +547,137 @@ CREATE OR REPLACE FUNCTION {catalog_name}.{schema}.get_filing_history(
 RETURNS STRING
 COMMENT 'Get company filing history from Companies House API'
 RETURN
-    {catalog_name}.{schema}.get_filing_history_inner(
+    {catalog_name}.{schema}.ch_request_inner(
+        'filings',
         company_number,
-        secret('companies_house', 'api_key'),
+        (SELECT secret('companies_house', 'api_key')),
         items_per_page,
-        start_index
+        start_index,
+        {catalog_name}.{schema}.ch_cache_lookup(
+            concat_ws('/', 'filings', company_number, items_per_page, start_index), 3600
+        )
     );
-"""
+""",
+    f"""
+CREATE OR REPLACE FUNCTION {catalog_name}.{schema}.ch_paginate(
+    endpoint STRING COMMENT 'Paginated endpoint: officers or filings',
+    company_number STRING COMMENT 'Company number'
+)
+RETURNS TABLE (item STRING)
+COMMENT 'Get every company officer or filing history item from Companies House API, fetching pages concurrently'
+RETURN
+    SELECT item
+    FROM {catalog_name}.{schema}.ch_paginate_inner(
+        endpoint,
+        company_number,
+        secret('companies_house', 'api_key')
+    );
+""",
+]
 
-spark.sql(query)
+
+def create_function(ddl: str) -> None:
+    try:
+        spark.sql(ddl)
+    except Exception as e:
+        raise RuntimeError(f"Failed to create function:\n{ddl}") from e
+
+
+# The functions are independent, so overlap the metastore round trips
+with ThreadPoolExecutor(max_workers=len(ddls)) as executor:
+    list(executor.map(create_function, ddls))
 
 # COMMAND ----------
 
-# DBTITLE 1,Test get_company_officers and get_filing_history
-# Test get_company_officers function
-print("Testing get_company_officers...")
-officers_df = spark.sql(
-    f"SELECT {catalog_name}.{schema}.get_company_officers('14307029') AS officers"
-)
-display(officers_df)
+# DBTITLE 1,Test search companies
+# MAGIC %sql
+# MAGIC -- Test search_companies function and parse JSON response
+# MAGIC SELECT
+# MAGIC   from_json(
+# MAGIC     search_companies('Databricks'),
+# MAGIC     'STRUCT<items:ARRAY<STRUCT<company_number:STRING, title:STRING, company_status:STRING, date_of_creation:STRING, address_snippet:STRING>>, total_results:INT>'
+# MAGIC   ) as result
 
-print("\nTesting get_filing_history...")
-filing_df = spark.sql(
-    f"SELECT {catalog_name}.{schema}.get_filing_history('14307029') AS filing_history"
-)
-display(filing_df)
+# COMMAND ----------
+
+# DBTITLE 1,Test get_company_profile, get_company_officers and get_filing_history
+# Run all three lookups as a single query so they share one Spark job
+result_df = spark.sql(f"""
+SELECT 'Company Profile' AS test_name, {catalog_name}.{schema}.get_company_profile('14307029') AS result
+UNION ALL
+SELECT 'Company Officers', {catalog_name}.{schema}.get_company_officers('14307029')
+UNION ALL
+SELECT 'Filing History', {catalog_name}.{schema}.get_filing_history('14307029')
+""")
+if run_mode == "interactive":
+    display(result_df)
+else:
+    result_df.collect()
+
+# COMMAND ----------
+
+# DBTITLE 1,Test ch_paginate
+# MAGIC %sql
+# MAGIC -- Test ch_paginate by fetching the full filing history and parsing each item
+# MAGIC SELECT
+# MAGIC   from_json(item, 'STRUCT<date:STRING, type:STRING, category:STRING, description:STRING>') AS filing
+# MAGIC FROM ch_paginate('filings', '14307029')
+# MAGIC
+
+# COMMAND ----------
+
+# DBTITLE 1,Register requests to cache
+# MAGIC %sql
+# MAGIC -- Register requests to keep in the response cache; the refresh cell below fetches them
+# MAGIC MERGE INTO api_cache t
+# MAGIC USING (
+# MAGIC   SELECT
+# MAGIC     concat_ws('/', endpoint, company_number, items_per_page, start_index) AS key,
+# MAGIC     endpoint,
+# MAGIC     company_number,
+# MAGIC     items_per_page,
+# MAGIC     start_index
+# MAGIC   FROM VALUES
+# MAGIC     ('profile', '14307029', CAST(NULL AS INT), CAST(NULL AS INT)),
+# MAGIC     ('officers', '14307029', 35, 0),
+# MAGIC     ('filings', '14307029', 25, 0)
+# MAGIC     AS requests(endpoint, company_number, items_per_page, start_index)
+# MAGIC ) s
+# MAGIC ON t.key = s.key
+# MAGIC WHEN NOT MATCHED THEN
+# MAGIC   INSERT (key, endpoint, company_number, items_per_page, start_index)
+# MAGIC   VALUES (s.key, s.endpoint, s.company_number, s.items_per_page, s.start_index)
+# MAGIC
+
+# COMMAND ----------
+
+# DBTITLE 1,Refresh API response cache
+# MAGIC %sql
+# MAGIC -- Fetch cached requests that are missing or older than their endpoint's TTL.
+# MAGIC -- Schedule this cell as a job to keep the cache warm; error responses are not cached.
+# MAGIC MERGE INTO api_cache t
+# MAGIC USING (
+# MAGIC   SELECT
+# MAGIC     key,
+# MAGIC     ch_request_inner(
+# MAGIC       endpoint,
+# MAGIC       company_number,
+# MAGIC       secret('companies_house', 'api_key'),
+# MAGIC       items_per_page,
+# MAGIC       start_index,
+# MAGIC       CAST(NULL AS STRING)
+# MAGIC     ) AS body
+# MAGIC   FROM api_cache
+# MAGIC   WHERE fetched_at IS NULL
+# MAGIC     OR fetched_at < current_timestamp() - make_dt_interval(
+# MAGIC       0, 0, 0,
+# MAGIC       CASE endpoint WHEN 'search' THEN 300 WHEN 'profile' THEN 86400 ELSE 3600 END
+# MAGIC     )
+# MAGIC ) s
+# MAGIC ON t.key = s.key
+# MAGIC WHEN MATCHED AND s.body NOT LIKE '{"error"%' THEN
+# MAGIC   UPDATE SET body = s.body, fetched_at = current_timestamp()
+# MAGIC
 
 # COMMAND ----------
 
@@ -428,13 +713,14 @@ display(filing_df)
 # MAGIC
 # MAGIC ### Secret Management
 # MAGIC * API key stored securely in Databricks Secrets (scope: `companies_house`, key: `api_key`)
-# MAGIC * Outer functions call `secret('companies_house', 'api_key')` directly
+# MAGIC * Outer functions resolve `secret('companies_house', 'api_key')` once per query with a scalar subquery, rather than once per row
 # MAGIC
 # MAGIC ### UC Functions
 # MAGIC
 # MAGIC All functions follow an inner/outer pattern:
-# MAGIC * **Inner functions** (`*_inner`) - Python functions that handle API calls with Basic authentication (http_request only supports connections with bearer token)
-# MAGIC * **Outer functions** - SQL wrappers that automatically retrieve the API key and pass it to inner functions. SQL functions can also handle default values whereas Python functions cannot
+# MAGIC * **Inner function** (`ch_request_inner`) - A single batch Python function that handles API calls for every endpoint with Basic authentication (http_request only supports connections with bearer token). Each Arrow batch of rows is fetched concurrently with `httpx` over a shared HTTP/2 connection pool, and the connection pool and response cache are shared by all endpoints
+# MAGIC * **Rate limiting** - Each Python worker paces its requests to the Companies House limit of 600 requests per 5 minutes, and retries 429 and 5xx responses with backoff
+# MAGIC * **Outer functions** - SQL wrappers that automatically retrieve the API key and pass it to the inner function along with the endpoint name. SQL functions can also handle default values whereas Python functions cannot
 # MAGIC
 # MAGIC #### Available Functions:
 # MAGIC 1. **search_companies(query, items_per_page, start_index)** - Search for companies
@@ -455,6 +741,15 @@ display(filing_df)
 # MAGIC    * `items_per_page` (INT, default: 25) - Number of results per page
 # MAGIC    * `start_index` (INT, default: 0) - Starting index for pagination
 # MAGIC
+# MAGIC 5. **ch_paginate(endpoint, company_number)** - Table function returning every officer or filing history item, one JSON row per item. Pages are fetched concurrently after a probe request reads the total
+# MAGIC    * `endpoint` (STRING) - `officers` or `filings`
+# MAGIC    * `company_number` (STRING) - Company registration number
+# MAGIC
+# MAGIC ### Response Cache
+# MAGIC * `api_cache` - Delta table of cached responses keyed by `endpoint/company_number[/items_per_page/start_index]` (the search query takes the place of the company number)
+# MAGIC * Outer functions look up a fresh entry with `ch_cache_lookup` and only call the API on a miss. TTLs: search 5 minutes, profile 24 hours, officers and filing history 1 hour
+# MAGIC * Register requests with the "Register requests to cache" cell and schedule "Refresh API response cache" to keep them warm
+# MAGIC
 # MAGIC ### Usage Examples
 # MAGIC
 # MAGIC ```sql
@@ -479,13 +774,16 @@ display(filing_df)
 # MAGIC
 # MAGIC -- Get filing history
 # MAGIC SELECT get_filing_history('14307029');
+# MAGIC
+# MAGIC -- Get the full filing history, one row per filing
+# MAGIC SELECT * FROM ch_paginate('filings', '14307029');
 # MAGIC ```
 # MAGIC
 # MAGIC ### Architecture Benefits
 # MAGIC
 # MAGIC * **Security**: API key is never exposed in queries - automatically retrieved from Databricks Secrets
 # MAGIC * **Simplicity**: Users call simple outer functions without managing credentials
-# MAGIC * **Flexibility**: Inner functions can be called directly if custom authentication is needed
+# MAGIC * **Flexibility**: The inner function can be called directly if custom authentication is needed
 # MAGIC * **Basic Auth Support**: Python functions support Basic authentication (required by Companies House API)
 # MAGIC
 # MAGIC ### API Documentation
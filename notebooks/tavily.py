@@ -27,6 +27,13 @@ print(f"Using schema: {schema}")
 
 # COMMAND ----------
 
+# DBTITLE 1,Create run mode widget
+# "interactive" displays test results; "job" runs the tests without rendering them
+dbutils.widgets.dropdown("run_mode", "interactive", ["interactive", "job"], "Run Mode")
+run_mode: str = dbutils.widgets.get("run_mode")
+
+# COMMAND ----------
+
 # DBTITLE 1,Create tavily schema
 # MAGIC %sql
 # MAGIC -- Create the schema
@@ -42,11 +49,9 @@ print(f"Using schema: {schema}")
 
 # DBTITLE 1,Create HTTP Connection to Tavily API
 # MAGIC %sql
-# MAGIC -- Drop existing HTTP Connection if it exists
-# MAGIC DROP CONNECTION IF EXISTS tavily_rest_api;
-# MAGIC
-# MAGIC -- Create HTTP Connection
-# MAGIC CREATE CONNECTION tavily_rest_api
+# MAGIC -- Create the HTTP Connection once and keep it across runs, so functions that
+# MAGIC -- reference it are never left without a connection
+# MAGIC CREATE CONNECTION IF NOT EXISTS tavily_rest_api
 # MAGIC TYPE HTTP
 # MAGIC OPTIONS (
 # MAGIC   host 'https://api.tavily.com',
@@ -54,6 +59,13 @@ print(f"Using schema: {schema}")
 # MAGIC   bearer_token :api_key
 # MAGIC )
 # MAGIC COMMENT 'HTTP connection to Tavily API';
+# MAGIC
+# MAGIC -- Apply the current API key in place rather than dropping and recreating
+# MAGIC ALTER CONNECTION tavily_rest_api OPTIONS (
+# MAGIC   host 'https://api.tavily.com',
+# MAGIC   port '443',
+# MAGIC   bearer_token :api_key
+# MAGIC );
 
 # COMMAND ----------
 
@@ -111,15 +123,31 @@ print(f"Using schema: {schema}")
 result_df = spark.sql(
     f"SELECT {catalog_name}.{schema}.search(search_query=>'databricks')"
 )
-display(result_df)
+if run_mode == "interactive":
+    display(result_df)
+else:
+    result_df.collect()
 
 # COMMAND ----------
 
-# DBTITLE 1,Create function to extract content from URLs
+# DBTITLE 1,Create extract cache table
 # MAGIC %sql
-# MAGIC -- Create UC Function to extract content from URLs using Tavily
-# MAGIC CREATE OR REPLACE FUNCTION extract(
+# MAGIC -- Create Delta table caching extract responses, filled by the "Cache extract results" cell
+# MAGIC CREATE TABLE IF NOT EXISTS extract_cache (
+# MAGIC   key STRING COMMENT 'SHA-256 of the extract request body',
 # MAGIC   urls STRING,
+# MAGIC   body STRING,
+# MAGIC   fetched_at TIMESTAMP
+# MAGIC )
+# MAGIC COMMENT 'Cached Tavily extract responses';
+
+# COMMAND ----------
+
+# DBTITLE 1,Create function to build extract request bodies
+# MAGIC %sql
+# MAGIC -- Create UC Function building the JSON body for the Tavily extract API
+# MAGIC CREATE OR REPLACE FUNCTION extract_request(
+# MAGIC   urls ARRAY<STRING>,
 # MAGIC   query STRING DEFAULT NULL,
 # MAGIC   chunks_per_source INT DEFAULT 3,
 # MAGIC   extract_depth STRING DEFAULT "basic",
@@ -131,25 +159,97 @@ display(result_df)
 # MAGIC )
 # MAGIC RETURNS STRING
 # MAGIC LANGUAGE SQL
-# MAGIC COMMENT 'Extract content from URLs using Tavily'
-# MAGIC RETURN (
-# MAGIC   SELECT http_request(
-# MAGIC     conn => 'tavily_rest_api',
-# MAGIC     method => 'POST',
-# MAGIC     path => '/extract',
-# MAGIC     json => to_json(named_struct(
-# MAGIC       'urls', urls,
-# MAGIC       'query', query,
-# MAGIC       'chunks_per_source', chunks_per_source,
-# MAGIC       'extract_depth', extract_depth,
-# MAGIC       'include_images', include_images,
-# MAGIC       'include_favicon', include_favicon,
-# MAGIC       'format', format,
-# MAGIC       'timeout', timeout,
-# MAGIC       'include_usage', include_usage
-# MAGIC     ))
-# MAGIC   ).text
-# MAGIC );
+# MAGIC COMMENT 'Build the JSON request body for the Tavily extract API'
+# MAGIC RETURN to_json(named_struct(
+# MAGIC   'urls', urls,
+# MAGIC   'query', query,
+# MAGIC   'chunks_per_source', chunks_per_source,
+# MAGIC   'extract_depth', extract_depth,
+# MAGIC   'include_images', include_images,
+# MAGIC   'include_favicon', include_favicon,
+# MAGIC   'format', format,
+# MAGIC   'timeout', timeout,
+# MAGIC   'include_usage', include_usage
+# MAGIC ));
+
+# COMMAND ----------
+
+# DBTITLE 1,Create extract cache lookup function
+# Spark evaluates http_request whether or not a cached body is found, so the cache
+# cannot short-circuit extract itself. Callers look up cached responses with this
+# function and only call extract for the misses. Parameter markers are not allowed
+# in persisted function bodies, so the catalog and schema are formatted in.
+query: str = f"""
+CREATE OR REPLACE FUNCTION {catalog_name}.{schema}.extract_cache_lookup(
+  request STRING COMMENT 'Extract request body, as built by extract_request'
+)
+RETURNS STRING
+COMMENT 'Return the Tavily extract response cached for a request within the last 24 hours, or NULL'
+RETURN
+  SELECT max_by(body, fetched_at)
+  FROM {catalog_name}.{schema}.extract_cache
+  WHERE key = sha2(request, 256)
+    AND fetched_at > current_timestamp() - INTERVAL 24 HOURS;
+"""
+
+spark.sql(query)
+
+# COMMAND ----------
+
+# DBTITLE 1,Create functions to extract content from URLs
+# extract_batch sends a list of URLs in one Tavily request; extract wraps it for a
+# single URL
+ddls: list[str] = [
+    f"""
+CREATE OR REPLACE FUNCTION {catalog_name}.{schema}.extract_batch(
+  urls ARRAY<STRING>,
+  query STRING DEFAULT NULL,
+  chunks_per_source INT DEFAULT 3,
+  extract_depth STRING DEFAULT "basic",
+  include_images BOOLEAN DEFAULT false,
+  include_favicon BOOLEAN DEFAULT false,
+  format STRING DEFAULT "markdown",
+  timeout STRING DEFAULT null,
+  include_usage BOOLEAN DEFAULT false
+)
+RETURNS STRING
+COMMENT 'Extract content from a list of URLs using a single Tavily request'
+RETURN (
+  SELECT http_request(
+    conn => 'tavily_rest_api',
+    method => 'POST',
+    path => '/extract',
+    json => {catalog_name}.{schema}.extract_request(
+      urls, query, chunks_per_source, extract_depth, include_images,
+      include_favicon, format, timeout, include_usage
+    )
+  ).text
+);
+""",
+    f"""
+CREATE OR REPLACE FUNCTION {catalog_name}.{schema}.extract(
+  urls STRING,
+  query STRING DEFAULT NULL,
+  chunks_per_source INT DEFAULT 3,
+  extract_depth STRING DEFAULT "basic",
+  include_images BOOLEAN DEFAULT false,
+  include_favicon BOOLEAN DEFAULT false,
+  format STRING DEFAULT "markdown",
+  timeout STRING DEFAULT null,
+  include_usage BOOLEAN DEFAULT false
+)
+RETURNS STRING
+COMMENT 'Extract content from URLs using Tavily'
+RETURN {catalog_name}.{schema}.extract_batch(
+  array(urls), query, chunks_per_source, extract_depth, include_images,
+  include_favicon, format, timeout, include_usage
+);
+""",
+]
+
+# extract calls extract_batch, so create them in order
+for ddl in ddls:
+    spark.sql(ddl)
 
 # COMMAND ----------
 
@@ -160,4 +260,32 @@ result_df = spark.sql(f"""
     urls => 'https://en.wikipedia.org/wiki/Artificial_intelligence'
   )
 """)
-display(result_df)
+if run_mode == "interactive":
+    display(result_df)
+else:
+    result_df.collect()
+
+# COMMAND ----------
+
+# DBTITLE 1,Cache extract results
+# MAGIC %sql
+# MAGIC -- Cache extract results for a list of URLs using the default options; add URLs as needed.
+# MAGIC -- Only URLs without a fresh cached response are fetched; rows are filtered out before
+# MAGIC -- extract runs, so cached URLs make no request. Error responses (which carry a "detail"
+# MAGIC -- field) are not cached.
+# MAGIC MERGE INTO extract_cache t
+# MAGIC USING (
+# MAGIC   SELECT
+# MAGIC     sha2(extract_request(urls => array(url)), 256) AS key,
+# MAGIC     url AS urls,
+# MAGIC     extract(urls => url) AS body
+# MAGIC   FROM VALUES
+# MAGIC     ('https://en.wikipedia.org/wiki/Artificial_intelligence')
+# MAGIC     AS requests(url)
+# MAGIC   WHERE extract_cache_lookup(extract_request(urls => array(url))) IS NULL
+# MAGIC ) s
+# MAGIC ON t.key = s.key
+# MAGIC WHEN MATCHED AND get_json_object(s.body, '$.detail') IS NULL THEN
+# MAGIC   UPDATE SET body = s.body, fetched_at = current_timestamp()
+# MAGIC WHEN NOT MATCHED AND get_json_object(s.body, '$.detail') IS NULL THEN
+# MAGIC   INSERT (key, urls, body, fetched_at) VALUES (s.key, s.urls, s.body, current_timestamp())
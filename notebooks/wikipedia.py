@@ -43,7 +43,7 @@ print(f"Using schema: {schema}")
 # COMMAND ----------
 
 # DBTITLE 1,Install required libraries
-# MAGIC %pip install mwxml requests mwparserfromhell
+# MAGIC %pip install mwxml requests mwparserfromhell tqdm
 
 # COMMAND ----------
 
@@ -52,51 +52,133 @@ print(f"Using schema: {schema}")
 
 # COMMAND ----------
 
+# DBTITLE 1,Read notebook parameters
+# %pip restarts Python, so the widgets are read once here, after the install, and
+# reused by the cells that follow
+catalog_name: str = dbutils.widgets.get("catalog")
+schema_name: str = dbutils.widgets.get("schema")
+
+# COMMAND ----------
+
 # DBTITLE 1,Download Wikipedia dump to volume
 import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import requests
-
-# Get catalog and schema from widgets
-catalog_name: str = dbutils.widgets.get("catalog")
-schema_name: str = dbutils.widgets.get("schema")
+from tqdm import tqdm
 
 # Use volume path instead of /tmp
 volume_path: str = f"/Volumes/{catalog_name}/{schema_name}/wikipedia_data"
 local_path: str = f"{volume_path}/wikipedia_dump.xml.bz2"
+index_path: str = f"{volume_path}/wikipedia_dump_index.txt.bz2"
 
-# Using full English Wikipedia dump
+# Using the multistream English Wikipedia dump: a series of independent bz2 streams of
+# 100 pages each, with an index of stream offsets so the dump can be parsed in parallel
 # Note: This is a large file (20GB+ compressed, 80GB+ uncompressed)
-wiki_url: str = (
-    "https://dumps.wikimedia.org/enwiki/latest/enwiki-latest-pages-articles.xml.bz2"
+wiki_url: str = "https://dumps.wikimedia.org/enwiki/latest/enwiki-latest-pages-articles-multistream.xml.bz2"
+index_url: str = "https://dumps.wikimedia.org/enwiki/latest/enwiki-latest-pages-articles-multistream-index.txt.bz2"
+
+# Stream in 1 MiB chunks through an 8 MiB write buffer, refreshing progress every 5s
+CHUNK_SIZE: int = 1024 * 1024
+
+# Fetch this many byte ranges in parallel when the server supports range requests.
+# Volumes do not support random writes, so the ranges are assembled on the driver's
+# local disk and then copied to the volume sequentially.
+DOWNLOAD_SEGMENTS: int = 8
+LOCAL_DOWNLOAD_DIR: str = (
+    "/local_disk0/tmp" if os.path.isdir("/local_disk0") else tempfile.gettempdir()
 )
 
+
+def progress_bar(total_size: int) -> tqdm:
+    return tqdm(
+        total=total_size or None,
+        unit="B",
+        unit_scale=True,
+        unit_divisor=1024,
+        mininterval=5.0,
+    )
+
+
+def download_range(url: str, path: str, start: int, end: int, progress: tqdm) -> None:
+    # Connection timeout of 30s, no read timeout for large streaming download
+    response = requests.get(
+        url, headers={"Range": f"bytes={start}-{end}"}, stream=True, timeout=(30, None)
+    )
+    response.raise_for_status()
+    if response.status_code != 206:
+        raise requests.HTTPError(f"Range request not honoured for {url}")
+
+    with open(path, "r+b", buffering=8 * 1024 * 1024) as f:
+        f.seek(start)
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            if chunk:
+                f.write(chunk)
+                progress.update(len(chunk))
+
+
+def download(url: str, path: str) -> None:
+    head = requests.head(url, allow_redirects=True, timeout=30)
+    total_size = int(head.headers.get("content-length", 0))
+
+    if total_size and head.headers.get("accept-ranges") == "bytes":
+        # Size the local file up front so each segment can write at its own offset
+        os.makedirs(LOCAL_DOWNLOAD_DIR, exist_ok=True)
+        local_file = os.path.join(LOCAL_DOWNLOAD_DIR, os.path.basename(path))
+        with open(local_file, "wb") as f:
+            f.truncate(total_size)
+
+        segment_size = -(-total_size // DOWNLOAD_SEGMENTS)
+        with (
+            progress_bar(total_size) as progress,
+            ThreadPoolExecutor(max_workers=DOWNLOAD_SEGMENTS) as executor,
+        ):
+            futures = [
+                executor.submit(
+                    download_range,
+                    url,
+                    local_file,
+                    start,
+                    min(start + segment_size, total_size) - 1,
+                    progress,
+                )
+                for start in range(0, total_size, segment_size)
+            ]
+            for future in futures:
+                future.result()
+
+        shutil.copyfile(local_file, path)
+        os.remove(local_file)
+    else:
+        # Connection timeout of 30s, no read timeout for large streaming download
+        response = requests.get(url, stream=True, timeout=(30, None))
+        total_size = int(response.headers.get("content-length", 0))
+
+        with (
+            open(path, "wb", buffering=8 * 1024 * 1024) as f,
+            progress_bar(total_size) as progress,
+        ):
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                if chunk:
+                    f.write(chunk)
+                    progress.update(len(chunk))
+
+    print(f"Download complete! File saved to {path}")
+    print(f"File size: {os.path.getsize(path) / (1024 * 1024 * 1024):.2f} GB")
+
+
 print(f"Volume path: {volume_path}")
+print(f"Downloading English Wikipedia dump index from {index_url}...")
+download(index_url, index_path)
+
 print(f"Downloading English Wikipedia dump from {wiki_url}...")
 print(
     "WARNING: This is a large file (20GB+ compressed). Download may take 30+ minutes..."
 )
-
-# Connection timeout of 30s, no read timeout for large streaming download
-response = requests.get(wiki_url, stream=True, timeout=(30, None))
-total_size = int(response.headers.get("content-length", 0))
-
-with open(local_path, "wb") as f:
-    downloaded = 0
-    for chunk in response.iter_content(chunk_size=8192):
-        if chunk:
-            f.write(chunk)
-            downloaded += len(chunk)
-            if total_size > 0:
-                percent = (downloaded / total_size) * 100
-                print(
-                    f"\rProgress: {percent:.1f}% ({downloaded / (1024 * 1024 * 1024):.2f} GB / {total_size / (1024 * 1024 * 1024):.2f} GB)",
-                    end="",
-                )
-
-print(f"\nDownload complete! File saved to {local_path}")
-print(f"File size: {os.path.getsize(local_path) / (1024 * 1024 * 1024):.2f} GB")
+download(wiki_url, local_path)
 
 # COMMAND ----------
 
@@ -110,162 +192,219 @@ print(f"File size: {os.path.getsize(local_path) / (1024 * 1024 * 1024):.2f} GB")
 
 # COMMAND ----------
 
-# DBTITLE 1,Decompress the bz2 file
+# DBTITLE 1,Parse XML and write to Delta in parallel
 import bz2
-import shutil
-
-# Get paths from volume
-catalog_name: str = dbutils.widgets.get("catalog")
-schema_name: str = dbutils.widgets.get("schema")
-volume_path: str = f"/Volumes/{catalog_name}/{schema_name}/wikipedia_data"
-
-compressed_path: str = f"{volume_path}/wikipedia_dump.xml.bz2"
-decompressed_path: str = f"{volume_path}/wikipedia_dump.xml"
-
-print("Decompressing bz2 file...")
-with bz2.open(compressed_path, "rb") as f_in:
-    with open(decompressed_path, "wb") as f_out:
-        shutil.copyfileobj(f_in, f_out)
-
-print(f"Decompression complete! File saved to {decompressed_path}")
-print(f"Decompressed size: {os.path.getsize(decompressed_path) / (1024 * 1024):.2f} MB")
-
-# COMMAND ----------
-
-# DBTITLE 1,Parse XML and write to Delta in batches
-from datetime import datetime
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import mwxml
-from pyspark.sql.types import IntegerType, LongType, StringType, StructField, StructType
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pyspark.sql.functions import max_by
 
-# Get XML path from volume
-catalog_name: str = dbutils.widgets.get("catalog")
-schema_name: str = dbutils.widgets.get("schema")
+# Get dump paths from volume
 volume_path: str = f"/Volumes/{catalog_name}/{schema_name}/wikipedia_data"
-xml_path: str = f"{volume_path}/wikipedia_dump.xml"
-json_intermediate_path: str = f"{volume_path}/wikipedia_articles_json"
+compressed_path: str = f"{volume_path}/wikipedia_dump.xml.bz2"
+index_path: str = f"{volume_path}/wikipedia_dump_index.txt.bz2"
+parquet_intermediate_path: str = f"{volume_path}/wikipedia_articles_parquet"
 
-# Delete intermediate JSON files before starting
-dbutils.fs.rm(json_intermediate_path, True)
+# Delete intermediate Parquet files before starting
+dbutils.fs.rm(parquet_intermediate_path, True)
 
-# Define schema for articles table
-articles_schema = StructType(
+# Define Arrow schema for articles table
+articles_schema = pa.schema(
     [
-        StructField("page_id", LongType(), True),
-        StructField("title", StringType(), True),
-        StructField("revision_id", LongType(), True),
-        StructField("timestamp", StringType(), True),
-        StructField("contributor_id", LongType(), True),
-        StructField("contributor_name", StringType(), True),
-        StructField("text", StringType(), True),
-        StructField("text_length", IntegerType(), True),
-        StructField("comment", StringType(), True),
+        ("page_id", pa.int64()),
+        ("title", pa.string()),
+        ("revision_id", pa.int64()),
+        ("timestamp", pa.string()),
+        ("contributor_id", pa.int64()),
+        ("contributor_name", pa.string()),
+        ("text", pa.string()),
+        ("text_length", pa.int32()),
+        ("comment", pa.string()),
     ]
 )
 
-# Table name
+# Table names
 table_name: str = f"{catalog_name}.{schema_name}.wikipedia_articles"
-
-print("Parsing Wikipedia XML dump and writing to JSON in batches...")
-print(f"Intermediate JSON path: {json_intermediate_path}\n")
-
-# Batch configuration - reduced to avoid gRPC message size limits
-BATCH_SIZE: int = 10000
-articles_batch: list = []
-count: int = 0
-batch_num: int = 0
-
-import json
-import os
-import uuid
+body_table: str = f"{catalog_name}.{schema_name}.wikipedia_articles_body"
+contributors_table: str = f"{catalog_name}.{schema_name}.wikipedia_contributors"
+
+# Each task decompresses and parses this many bz2 streams (~100 pages each) into one
+# Parquet shard
+STREAMS_PER_TASK: int = 200
+TIMESTAMP_FORMAT: str = "%Y-%m-%d %H:%M:%S"
+
+# The index has one "offset:page_id:title" line per page; each distinct offset starts
+# a bz2 stream of complete <page> elements that can be decompressed on its own
+offsets: list[int] = []
+with bz2.open(index_path, "rt", encoding="utf-8") as index:
+    for line in index:
+        offset = int(line.split(":", 1)[0])
+        if not offsets or offset != offsets[-1]:
+            offsets.append(offset)
+# The last stream runs to the end of the dump
+offsets.append(os.path.getsize(compressed_path))
+
+tasks: list[tuple[int, int, int]] = [
+    (shard, offsets[i], offsets[min(i + STREAMS_PER_TASK, len(offsets) - 1)])
+    for shard, i in enumerate(range(0, len(offsets) - 1, STREAMS_PER_TASK))
+]
 
 # Ensure intermediate directory exists
-os.makedirs(json_intermediate_path, exist_ok=True)
-
-
-def write_batch_to_json(articles_batch: list, batch_num: int, count: int) -> None:
-    json_file = os.path.join(
-        json_intermediate_path, f"batch_{batch_num}_{uuid.uuid4().hex}.json"
-    )
-    with open(json_file, "w", encoding="utf-8") as jf:
-        for art in articles_batch:
-            jf.write(json.dumps(art, ensure_ascii=False) + "\n")
-    print(
-        f"Batch {batch_num}: Wrote {len(articles_batch)} articles to JSON (Total: {count})"
-    )
-
-
-with open(xml_path, "rb") as f:
-    dump = mwxml.Dump.from_file(f)
-
-    for page in dump:
+os.makedirs(parquet_intermediate_path, exist_ok=True)
+
+
+def parse_streams(shard: int, start: int, end: int) -> int:
+    """Parse the bz2 streams in dump bytes [start, end) into one Parquet shard."""
+    with open(compressed_path, "rb") as f:
+        f.seek(start)
+        page_xml = bz2.decompress(f.read(end - start)).decode("utf-8")
+    # The last stream closes the <mediawiki> element, which from_page_xml adds itself
+    page_xml = page_xml.replace("</mediawiki>", "")
+
+    # Accumulate the shard column-wise, one list per field of articles_schema
+    batch_columns: list[list] = [[] for _ in articles_schema.names]
+    (
+        page_ids,
+        titles,
+        revision_ids,
+        timestamps,
+        contributor_ids,
+        contributor_names,
+        texts,
+        text_lengths,
+        comments,
+    ) = batch_columns
+
+    for page in mwxml.Dump.from_page_xml(page_xml):
         # Skip redirect pages and non-article pages
         if page.redirect or page.namespace != 0:
             continue
 
         # Get the latest revision
         for revision in page:
-            article = {
-                "page_id": page.id,
-                "title": page.title,
-                "revision_id": revision.id,
-                "timestamp": revision.timestamp.strftime("%Y-%m-%d %H:%M:%S")
+            page_ids.append(page.id)
+            titles.append(page.title)
+            revision_ids.append(revision.id)
+            timestamps.append(
+                revision.timestamp.strftime(TIMESTAMP_FORMAT)
                 if revision.timestamp
-                else None,
-                "contributor_id": revision.user.id if revision.user else None,
-                "contributor_name": revision.user.text if revision.user else None,
-                "text": revision.text if revision.text else "",
-                "text_length": len(revision.text) if revision.text else 0,
-                "comment": revision.comment if hasattr(revision, "comment") else None,
-            }
-            articles_batch.append(article)
-            count += 1
-
-            # Write batch to JSON when batch size is reached
-            if len(articles_batch) >= BATCH_SIZE:
-                batch_num += 1
-                write_batch_to_json(articles_batch, batch_num, count)
-                articles_batch = []  # Clear batch
+                else None
+            )
+            contributor_ids.append(revision.user.id if revision.user else None)
+            contributor_names.append(revision.user.text if revision.user else None)
+            texts.append(revision.text if revision.text else "")
+            text_lengths.append(len(revision.text) if revision.text else 0)
+            comments.append(getattr(revision, "comment", None))
 
             # Only take the latest revision
             break
 
-# Write remaining articles in final batch
-if articles_batch:
-    batch_num += 1
-    write_batch_to_json(articles_batch, batch_num, count)
+    pq.write_table(
+        pa.Table.from_arrays(
+            [
+                pa.array(column, type=field.type)
+                for column, field in zip(batch_columns, articles_schema, strict=True)
+            ],
+            schema=articles_schema,
+        ),
+        os.path.join(parquet_intermediate_path, f"shard_{shard:05d}.parquet"),
+    )
+    return len(page_ids)
+
+
+print("Parsing Wikipedia XML dump and writing to Parquet in parallel...")
+print(f"Intermediate Parquet path: {parquet_intermediate_path}")
+print(f"{len(offsets) - 1:,} bz2 streams in {len(tasks):,} tasks\n")
+
+# Fork so workers inherit the functions and paths defined in this notebook
+count: int = 0
+with ProcessPoolExecutor(
+    max_workers=os.cpu_count(), mp_context=multiprocessing.get_context("fork")
+) as executor:
+    futures = [executor.submit(parse_streams, *task) for task in tasks]
+    for done, future in enumerate(as_completed(futures), start=1):
+        count += future.result()
+        print(f"\rTasks: {done}/{len(tasks)} (Total articles: {count})", end="")
 
 print(f"\n[OK] Parsing complete! Total articles processed: {count}")
-print(f"[OK] Data written to JSON files at: {json_intermediate_path}")
+print(f"[OK] Data written to Parquet files at: {parquet_intermediate_path}")
 
-# Read JSON files as Spark DataFrame and write to Delta table
-print("\nLoading JSON files into Spark DataFrame and writing to Delta table...")
-df = spark.read.schema(articles_schema).json(json_intermediate_path)
-df.write.format("delta").mode("overwrite").option(
+# Read Parquet files as Spark DataFrame and write to Delta tables
+print("\nLoading Parquet files into Spark DataFrame and writing to Delta tables...")
+df = spark.read.parquet(parquet_intermediate_path)
+
+# Contributor names live in a contributor_id -> contributor_name dimension table so
+# the article tables only carry the id. Anonymous (IP) edits have no contributor_id.
+spark.sql(f"""
+CREATE TABLE IF NOT EXISTS {contributors_table} (
+    contributor_id BIGINT,
+    contributor_name STRING
+)
+USING DELTA
+CLUSTER BY (contributor_id)
+""")
+df.where("contributor_id IS NOT NULL").groupBy("contributor_id").agg(
+    max_by("contributor_name", "timestamp").alias("contributor_name")
+).createOrReplaceTempView("parsed_contributors")
+spark.sql(f"""
+MERGE INTO {contributors_table} AS target
+USING parsed_contributors AS source
+ON target.contributor_id = source.contributor_id
+WHEN MATCHED AND target.contributor_name <> source.contributor_name THEN
+  UPDATE SET target.contributor_name = source.contributor_name
+WHEN NOT MATCHED THEN
+  INSERT (contributor_id, contributor_name)
+  VALUES (source.contributor_id, source.contributor_name)
+""")
+print(f"[OK] Contributors written to table: {contributors_table}")
+
+# Article metadata only: the text column is kept in a separate body table so the
+# MERGE into wikipedia_articles_latest never shuffles article text
+df.drop("text", "contributor_name").write.format("delta").mode("overwrite").option(
     "overwriteSchema", "true"
 ).saveAsTable(table_name)
 print(f"[OK] Data written to table: {table_name}")
 
-# Clean up intermediate JSON files
-import shutil
-
-if os.path.exists(json_intermediate_path):
-    shutil.rmtree(json_intermediate_path)
-    print(f"[OK] Cleaned up intermediate JSON files at: {json_intermediate_path}")
+# Article text is append-only, keyed on (page_id, revision_id): add new revisions only
+spark.sql(f"""
+CREATE TABLE IF NOT EXISTS {body_table} (
+    page_id BIGINT,
+    revision_id BIGINT,
+    text STRING
+)
+USING DELTA
+CLUSTER BY (page_id, revision_id)
+""")
+df.select("page_id", "revision_id", "text").join(
+    spark.table(body_table).select("page_id", "revision_id"),
+    ["page_id", "revision_id"],
+    "left_anti",
+).write.format("delta").mode("append").saveAsTable(body_table)
+print(f"[OK] New revisions written to table: {body_table}")
+
+# Clean up intermediate Parquet files
+if os.path.exists(parquet_intermediate_path):
+    shutil.rmtree(parquet_intermediate_path)
+    print(f"[OK] Cleaned up intermediate Parquet files at: {parquet_intermediate_path}")
 
 # COMMAND ----------
 
 # DBTITLE 1,Verify table and show sample data
-# Get table name
-catalog_name: str = dbutils.widgets.get("catalog")
-schema_name: str = dbutils.widgets.get("schema")
+# Get table names
 table_name: str = f"{catalog_name}.{schema_name}.wikipedia_articles"
+contributors_table: str = f"{catalog_name}.{schema_name}.wikipedia_contributors"
 
-# Read the table
-df = spark.table(table_name)
+# Read the table, joining contributor names back from the dimension table
+df = spark.table(table_name).join(
+    spark.table(contributors_table), "contributor_id", "left"
+)
 
 print(f"Table: {table_name}")
-print(f"Total rows: {df.count():,}")
+# COUNT(*) on a Delta table is answered from the transaction log without a scan
+print(f"Total rows: {spark.sql(f'SELECT COUNT(*) FROM {table_name}').first()[0]:,}")
 print("\nSchema:")
 df.printSchema()
 
@@ -279,7 +418,7 @@ display(df.limit(10))
 # MAGIC -- Show table statistics
 # MAGIC SELECT
 # MAGIC     COUNT(*) as total_articles,
-# MAGIC     COUNT(DISTINCT contributor_name) as unique_contributors,
+# MAGIC     COUNT(DISTINCT contributor_id) as unique_contributors,
 # MAGIC     AVG(text_length) as avg_text_length,
 # MAGIC     MAX(text_length) as max_text_length,
 # MAGIC     MIN(timestamp) as earliest_edit,
@@ -290,9 +429,10 @@ display(df.limit(10))
 
 # DBTITLE 1,Create wikipedia_articles_latest with CDF enabled
 # MAGIC %sql
-# MAGIC -- Create the target table with CDF enabled
+# MAGIC -- Create the target table with CDF enabled, clustered on the MERGE key
 # MAGIC CREATE TABLE IF NOT EXISTS IDENTIFIER(:catalog || '.' || :schema || '.wikipedia_articles_latest')
 # MAGIC USING DELTA
+# MAGIC CLUSTER BY (page_id)
 # MAGIC TBLPROPERTIES (delta.enableChangeDataFeed = true)
 # MAGIC AS SELECT * FROM IDENTIFIER(:catalog || '.' || :schema || '.wikipedia_articles')
 # MAGIC WHERE 1=0  -- Create the table but don't copy data
@@ -311,24 +451,29 @@ display(df.limit(10))
 # MAGIC     target.revision_id = source.revision_id,
 # MAGIC     target.timestamp = source.timestamp,
 # MAGIC     target.contributor_id = source.contributor_id,
-# MAGIC     target.contributor_name = source.contributor_name,
-# MAGIC     target.text = source.text,
 # MAGIC     target.text_length = source.text_length,
 # MAGIC     target.comment = source.comment
 # MAGIC WHEN NOT MATCHED THEN
-# MAGIC   INSERT (page_id, title, revision_id, timestamp, contributor_id, contributor_name, text, text_length, comment)
-# MAGIC   VALUES (source.page_id, source.title, source.revision_id, source.timestamp, source.contributor_id, source.contributor_name, source.text, source.text_length, source.comment)
+# MAGIC   INSERT (page_id, title, revision_id, timestamp, contributor_id, text_length, comment)
+# MAGIC   VALUES (source.page_id, source.title, source.revision_id, source.timestamp, source.contributor_id, source.text_length, source.comment)
 # MAGIC WHEN NOT MATCHED BY SOURCE THEN
 # MAGIC   DELETE
 
 # COMMAND ----------
 
+# DBTITLE 1,Cluster wikipedia_articles_latest by page_id
+# MAGIC %sql
+# MAGIC -- Cluster merged files on page_id so later MERGEs skip files that hold no matching pages
+# MAGIC OPTIMIZE IDENTIFIER(:catalog || '.' || :schema || '.wikipedia_articles_latest')
+
+# COMMAND ----------
+
 # DBTITLE 1,Verify the new table
 # MAGIC %sql
 # MAGIC -- Verify the merge results
 # MAGIC SELECT
 # MAGIC     COUNT(*) as total_articles,
-# MAGIC     COUNT(DISTINCT contributor_name) as unique_contributors,
+# MAGIC     COUNT(DISTINCT contributor_id) as unique_contributors,
 # MAGIC     AVG(text_length) as avg_text_length,
 # MAGIC     MAX(text_length) as max_text_length,
 # MAGIC     MIN(timestamp) as earliest_edit,
@@ -343,13 +488,34 @@ display(df.limit(10))
 # COMMAND ----------
 
 # DBTITLE 1,Define markup removal function
+import html
 from collections.abc import Iterator
 
 import mwparserfromhell
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 from pyspark.sql.functions import pandas_udf
 from pyspark.sql.types import StringType
 
+# Set to True to clean with the (much slower) mwparserfromhell parser instead
+USE_MWPARSERFROMHELL: bool = False
+
+# Markup patterns (RE2 syntax, run by Arrow's compute kernels), applied in this order.
+# Templates and tables can nest, so their patterns match innermost blocks only and
+# are applied until nothing changes.
+_RE_COMMENT = r"(?s)<!--.*?-->"
+_RE_REF = r"(?si)<ref[^>/]*/>|<ref[^>]*>.*?</ref>"
+_RE_TEMPLATE = r"\{\{[^{}]*\}\}"
+_RE_TABLE = r"(?s)\{\|(?:[^{]|\{[^|])*?\|\}"
+_RE_FILE = r"(?i)\[\[(?:File|Image|Category):[^\[\]]*\]\]"
+_RE_LINK = r"\[\[(?:[^|\[\]]*\|)?([^\[\]]*)\]\]"
+_RE_EXTERNAL_LINK = r"\[(?:https?:)?//[^\s\]]*\s*([^\]]*)\]"
+_RE_HEADING = r"(?m)^=+\s*(.*?)\s*=+\s*$"
+_RE_FORMATTING = r"'{2,}"
+_RE_TAG = r"<[^>]+>"
+_RE_WS = r"[\s\p{Z}]+"
+
 
 def remove_wikipedia_markup(text):
     """
@@ -360,22 +526,55 @@ def remove_wikipedia_markup(text):
         return ""
 
     try:
-        # Parse the wikitext
-        wikicode = mwparserfromhell.parse(text)
-
-        # Strip all markup and return plain text
-        # This removes templates, links, formatting, etc.
-        plain_text = wikicode.strip_code()
-
-        # Clean up extra whitespace
-        plain_text = " ".join(plain_text.split())
-
-        return plain_text.strip()
+        # Parse the wikitext and strip all markup, returning plain text
+        plain_text = mwparserfromhell.parse(text).strip_code()
+        return " ".join(plain_text.split())
     except Exception:
         # If parsing fails, return empty string
         return ""
 
 
+def _remove_nested(pattern: str, text: pa.Array) -> pa.Array:
+    """Remove innermost matches of pattern repeatedly until no row has any left."""
+    while pc.any(pc.match_substring_regex(text, pattern)).as_py():
+        text = pc.replace_substring_regex(text, pattern, "")
+    return text
+
+
+def remove_wikipedia_markup_batch(series: pd.Series) -> pd.Series:
+    """
+    Remove Wikipedia markup from a batch of article texts using regexes run by
+    Arrow compute kernels, without boxing each string as a Python object. The work
+    is done in utf8 (pa.string()), the type Spark builds StringType batches from.
+    """
+    text = pc.fill_null(pa.array(series, type=pa.string(), from_pandas=True), "")
+    text = pc.replace_substring_regex(text, _RE_COMMENT, "")
+    text = pc.replace_substring_regex(text, _RE_REF, "")
+    text = _remove_nested(_RE_TEMPLATE, text)
+    text = _remove_nested(_RE_TABLE, text)
+    # Drop files and categories, keep link labels, then drop files whose captions
+    # held links
+    text = pc.replace_substring_regex(text, _RE_FILE, "")
+    text = pc.replace_substring_regex(text, _RE_LINK, r"\1")
+    text = pc.replace_substring_regex(text, _RE_FILE, "")
+    text = pc.replace_substring_regex(text, _RE_EXTERNAL_LINK, r"\1")
+    text = pc.replace_substring_regex(text, _RE_HEADING, r"\1")
+    text = pc.replace_substring_regex(text, _RE_FORMATTING, "")
+    text = pc.replace_substring_regex(text, _RE_TAG, "")
+
+    # Decode entities such as &nbsp;, in Python for only the rows that contain any
+    has_entity = pc.match_substring(text, "&")
+    if pc.any(has_entity).as_py():
+        decoded = [html.unescape(t) for t in pc.filter(text, has_entity).to_pylist()]
+        text = pc.replace_with_mask(
+            text, has_entity, pa.array(decoded, type=pa.string())
+        )
+
+    # Clean up extra whitespace
+    text = pc.utf8_trim_whitespace(pc.replace_substring_regex(text, _RE_WS, " "))
+    return pd.Series(text, index=series.index, dtype=pd.ArrowDtype(pa.string()))
+
+
 # Register as Pandas UDF (vectorized) for better performance
 # Using iterator of series for optimal memory usage with large datasets
 @pandas_udf(StringType())
@@ -385,11 +584,13 @@ def remove_markup_udf(iterator: Iterator[pd.Series]) -> Iterator[pd.Series]:
     This is significantly faster than row-by-row processing.
     """
     for series in iterator:
-        # Apply the markup removal function to each element in the batch
-        yield series.apply(remove_wikipedia_markup)
+        if USE_MWPARSERFROMHELL:
+            yield series.apply(remove_wikipedia_markup)
+        else:
+            yield remove_wikipedia_markup_batch(series)
 
 
-print("[OK] Markup removal function defined using mwparserfromhell")
+print("[OK] Markup removal function defined using Arrow regex kernels")
 print("[OK] Pandas UDF registered for vectorized processing (faster!)")
 print("[OK] Using iterator of series pattern for optimal memory usage")
 
@@ -397,8 +598,6 @@ print("[OK] Using iterator of series pattern for optimal memory usage")
 
 # DBTITLE 1,Create wikipedia_articles_cleaned table
 # Create the target table if it doesn't exist
-catalog_name: str = dbutils.widgets.get("catalog")
-schema_name: str = dbutils.widgets.get("schema")
 target_table: str = f"{catalog_name}.{schema_name}.wikipedia_articles_cleaned"
 
 # Create empty table with the correct schema
@@ -409,13 +608,13 @@ CREATE TABLE IF NOT EXISTS {target_table} (
     revision_id BIGINT,
     timestamp STRING,
     contributor_id BIGINT,
-    contributor_name STRING,
     text_cleaned STRING,
     text_length_original INT,
     text_length_cleaned INT,
     comment STRING
 )
 USING DELTA
+CLUSTER BY (page_id)
 """)
 
 print(f"[OK] Target table created/verified: {target_table}")
@@ -426,9 +625,8 @@ print(f"[OK] Target table created/verified: {target_table}")
 from pyspark.sql.functions import col, length, when
 
 # Get parameters
-catalog_name: str = dbutils.widgets.get("catalog")
-schema_name: str = dbutils.widgets.get("schema")
 source_table: str = f"{catalog_name}.{schema_name}.wikipedia_articles_latest"
+body_table: str = f"{catalog_name}.{schema_name}.wikipedia_articles_body"
 target_table: str = f"{catalog_name}.{schema_name}.wikipedia_articles_cleaned"
 checkpoint_path: str = (
     f"/Volumes/{catalog_name}/{schema_name}/wikipedia_data/checkpoints/cdf_stream"
@@ -444,9 +642,13 @@ df_stream = (
     .option("readChangeFeed", "true")
     .option("startingVersion", "0")  # Start from beginning
     .table(source_table)
+    # Pre-images duplicate the page_id of their post-image and are never merged
+    .filter(col("_change_type") != "update_preimage")
+    # Look up each revision's text from the body table
+    .join(spark.table(body_table), ["page_id", "revision_id"], "left")
 )
 
-# Process all change types: insert, update, delete
+# Process the remaining change types: insert, update_postimage, delete
 # For inserts and updates, clean the text
 # For deletes, we'll handle them in the merge
 df_changes = (
@@ -470,7 +672,6 @@ df_changes = (
         col("revision_id"),
         col("timestamp"),
         col("contributor_id"),
-        col("contributor_name"),
         col("text_cleaned"),
         col("text_length").alias("text_length_original"),
         col("text_length_cleaned"),
@@ -490,13 +691,13 @@ def merge_to_cleaned_table(batch_df, batch_id):
     MERGE INTO {target_table} AS target
     USING cdf_batch AS source
     ON target.page_id = source.page_id
-    WHEN MATCHED AND source._change_type IN ('update_postimage', 'update_preimage') THEN
+    WHEN MATCHED AND source._change_type = 'update_postimage'
+      AND target.revision_id <> source.revision_id THEN
       UPDATE SET
         target.title = source.title,
         target.revision_id = source.revision_id,
         target.timestamp = source.timestamp,
         target.contributor_id = source.contributor_id,
-        target.contributor_name = source.contributor_name,
         target.text_cleaned = source.text_cleaned,
         target.text_length_original = source.text_length_original,
         target.text_length_cleaned = source.text_length_cleaned,
@@ -504,10 +705,10 @@ def merge_to_cleaned_table(batch_df, batch_id):
     WHEN MATCHED AND source._change_type = 'delete' THEN
       DELETE
     WHEN NOT MATCHED AND source._change_type = 'insert' THEN
-      INSERT (page_id, title, revision_id, timestamp, contributor_id, contributor_name,
+      INSERT (page_id, title, revision_id, timestamp, contributor_id,
               text_cleaned, text_length_original, text_length_cleaned, comment)
       VALUES (source.page_id, source.title, source.revision_id, source.timestamp,
-              source.contributor_id, source.contributor_name, source.text_cleaned,
+              source.contributor_id, source.text_cleaned,
               source.text_length_original, source.text_length_cleaned, source.comment)
     """
 
@@ -529,6 +730,9 @@ print("Processing CDF changes (inserts, updates, deletes) with Pandas UDF...")
 # Wait for the stream to complete
 query.awaitTermination()
 
+# Cluster merged files on page_id so later MERGEs skip files that hold no matching pages
+spark.sql(f"OPTIMIZE {target_table}")
+
 print("\n[OK] Stream processing complete!")
 print(f"[OK] Cleaned articles written to: {target_table}")
 print("[OK] Deletes from source are now reflected in cleaned table")
@@ -537,15 +741,14 @@ print("[OK] Deletes from source are now reflected in cleaned table")
 
 # DBTITLE 1,Verify cleaned table
 # Get table name
-catalog_name: str = dbutils.widgets.get("catalog")
-schema_name: str = dbutils.widgets.get("schema")
 table_name: str = f"{catalog_name}.{schema_name}.wikipedia_articles_cleaned"
 
 # Read the cleaned table
 df_cleaned = spark.table(table_name)
 
 print(f"Table: {table_name}")
-print(f"Total rows: {df_cleaned.count():,}")
+# COUNT(*) on a Delta table is answered from the transaction log without a scan
+print(f"Total rows: {spark.sql(f'SELECT COUNT(*) FROM {table_name}').first()[0]:,}")
 print("\nSchema:")
 df_cleaned.printSchema()
 
@@ -553,7 +756,7 @@ df_cleaned.printSchema()
 print("\nStatistics:")
 df_stats = df_cleaned.selectExpr(
     "COUNT(*) as total_articles",
-    "COUNT(DISTINCT contributor_name) as unique_contributors",
+    "COUNT(DISTINCT contributor_id) as unique_contributors",
     "AVG(text_length_original) as avg_original_length",
     "AVG(text_length_cleaned) as avg_cleaned_length",
     "AVG(text_length_original - text_length_cleaned) as avg_markup_removed",
@@ -566,37 +769,40 @@ display(df_stats)
 # COMMAND ----------
 
 # DBTITLE 1,Compare original vs cleaned text
-from pyspark.sql.functions import col
+from pyspark.sql.functions import broadcast, col
 
 # Get table names
-catalog_name: str = dbutils.widgets.get("catalog")
-schema_name: str = dbutils.widgets.get("schema")
-original_table: str = f"{catalog_name}.{schema_name}.wikipedia_articles_latest"
+body_table: str = f"{catalog_name}.{schema_name}.wikipedia_articles_body"
 cleaned_table: str = f"{catalog_name}.{schema_name}.wikipedia_articles_cleaned"
 
-# Join original and cleaned tables to compare
-df_original = spark.table(original_table).select(
-    col("page_id"),
-    col("title"),
-    col("text").alias("text_original"),
-    col("text_length").alias("length_original"),
-)
-
-df_cleaned = spark.table(cleaned_table).select(
-    col("page_id"),
-    col("text_cleaned"),
-    col("text_length_cleaned").alias("length_cleaned"),
+# Find the top articles by markup removed from the cleaned table alone, which holds
+# both lengths, so only those rows are joined back to fetch the original text
+df_top = (
+    spark.table(cleaned_table)
+    .select(
+        col("page_id"),
+        col("revision_id"),
+        col("title"),
+        col("text_cleaned"),
+        col("text_length_original").alias("length_original"),
+        col("text_length_cleaned").alias("length_cleaned"),
+        (col("text_length_original") - col("text_length_cleaned")).alias(
+            "markup_removed"
+        ),
+    )
+    .orderBy(col("markup_removed").desc())
+    .limit(10)
 )
 
-# Join and show comparison
 df_comparison = (
-    df_original.join(df_cleaned, "page_id")
+    spark.table(body_table)
+    .join(broadcast(df_top), ["page_id", "revision_id"])
     .select(
         col("title"),
         col("length_original"),
         col("length_cleaned"),
-        (col("length_original") - col("length_cleaned")).alias("markup_removed"),
-        col("text_original").substr(1, 500).alias("original_preview"),
+        col("markup_removed"),
+        col("text").substr(1, 500).alias("original_preview"),
         col("text_cleaned").substr(1, 500).alias("cleaned_preview"),
     )
     .orderBy(col("markup_removed").desc())
@@ -604,7 +810,7 @@ df_comparison = (
 
 print("Comparison of original vs cleaned text (top articles by markup removed):")
 print("\nShowing first 500 characters of each...\n")
-display(df_comparison.limit(10))
+display(df_comparison)
 
 # COMMAND ----------
 
@@ -616,11 +822,24 @@ display(df_comparison.limit(10))
 # COMMAND ----------
 
 # DBTITLE 1,Install required libraries
-# MAGIC %pip install databricks-vectorsearch langchain langchain-text-splitters
+# MAGIC %pip install databricks-vectorsearch langchain langchain-text-splitters mlflow
 # MAGIC dbutils.library.restartPython()
 
 # COMMAND ----------
 
+# DBTITLE 1,Read notebook parameters
+# Python restarted after the install above, so the widgets are read again and the
+# table, index and endpoint names shared by the cells below are set here once
+catalog_name: str = dbutils.widgets.get("catalog")
+schema_name: str = dbutils.widgets.get("schema")
+chunks_table: str = f"{catalog_name}.{schema_name}.wikipedia_chunks"
+index_name: str = f"{catalog_name}.{schema_name}.wikipedia_chunks_index"
+endpoint_name: str = "wikipedia_vector_search_endpoint"
+# Databricks foundation model that embeds both the indexed chunks and the test queries
+embedding_endpoint: str = "databricks-gte-large-en"
+
+# COMMAND ----------
+
 # DBTITLE 1,Define chunking strategy with LangChain
 from collections.abc import Iterator
 
@@ -656,6 +875,12 @@ chunk_schema = ArrayType(
     )
 )
 
+# Metadata shared by every chunk; chunk_size is added per chunk
+CHUNK_METADATA: dict[str, str] = {
+    "source": "wikipedia",
+    "splitter": "RecursiveCharacterTextSplitter",
+}
+
 
 @pandas_udf(chunk_schema)
 def chunk_text_udf(batch_iter: Iterator[pd.Series]) -> Iterator[pd.Series]:
@@ -664,30 +889,27 @@ def chunk_text_udf(batch_iter: Iterator[pd.Series]) -> Iterator[pd.Series]:
     Processes batches of text for better performance.
     """
     for series in batch_iter:
-        results = []
-        for text in series:
-            # Handle nulls or empty text
-            if not text or len(str(text).strip()) == 0:
-                results.append([])
-                continue
-
-            # Split the text using LangChain
-            chunks = text_splitter.create_documents([str(text)])
-
-            # Format output as a list of structs
-            row_chunks = [
+        # Handle nulls and blank text for the whole batch at once
+        texts = series.fillna("").astype(object)
+        has_text = texts.str.strip().str.len() > 0
+
+        # split_text returns plain strings, skipping LangChain Document construction
+        results = [
+            [
                 {
-                    "chunk_text": chunk.page_content,
+                    "chunk_text": chunk,
                     "chunk_index": str(idx),
                     "chunk_metadata": {
-                        "source": "wikipedia",
-                        "chunk_size": str(len(chunk.page_content)),
-                        "splitter": "RecursiveCharacterTextSplitter",
+                        **CHUNK_METADATA,
+                        "chunk_size": str(len(chunk)),
                     },
                 }
-                for idx, chunk in enumerate(chunks)
+                for idx, chunk in enumerate(text_splitter.split_text(text))
             ]
-            results.append(row_chunks)
+            if keep
+            else []
+            for text, keep in zip(texts, has_text, strict=True)
+        ]
         yield pd.Series(results)
 
 
@@ -702,8 +924,6 @@ print("  - Separators: paragraph > newline > sentence > space")
 from pyspark.sql.functions import col
 
 # Get table name
-catalog_name: str = dbutils.widgets.get("catalog")
-schema_name: str = dbutils.widgets.get("schema")
 source_table: str = f"{catalog_name}.{schema_name}.wikipedia_articles_latest"
 
 print(f"Reading Change Data Feed from: {source_table}\n")
@@ -723,32 +943,37 @@ df_change_summary = (
 )
 display(df_change_summary)
 
+# Reuse the distribution for the per-type counts rather than scanning the CDF per type
+counts: dict[str, int] = {
+    row["_change_type"]: row["count"] for row in df_change_summary.collect()
+}
+
 # Show sample of changes by type
 print("\nSample changes by type:")
 for change_type in ["insert", "update_postimage", "update_preimage", "delete"]:
-    df_sample = (
-        df_cdf.filter(f"_change_type = '{change_type}'")
-        .select(
-            "_change_type", "_commit_version", "_commit_timestamp", "page_id", "title"
-        )
-        .limit(5)
-    )
-
-    count = df_cdf.filter(f"_change_type = '{change_type}'").count()
+    count = counts.get(change_type, 0)
     if count > 0:
+        df_sample = (
+            df_cdf.filter(f"_change_type = '{change_type}'")
+            .select(
+                "_change_type",
+                "_commit_version",
+                "_commit_timestamp",
+                "page_id",
+                "title",
+            )
+            .limit(5)
+        )
         print(f"\n{change_type.upper()} changes (showing 5 of {count:,}):")
         display(df_sample)
 
 # COMMAND ----------
 
 # DBTITLE 1,Create and populate chunks table
-from pyspark.sql.functions import col, concat_ws, explode, lit, md5, to_json
+from pyspark.sql.functions import col, explode, lit, to_json
 
 # Get parameters
-catalog_name: str = dbutils.widgets.get("catalog")
-schema_name: str = dbutils.widgets.get("schema")
 source_table: str = f"{catalog_name}.{schema_name}.wikipedia_articles_cleaned"
-chunks_table: str = f"{catalog_name}.{schema_name}.wikipedia_chunks"
 
 print(f"Source table: {source_table}")
 print(f"Target chunks table: {chunks_table}")
@@ -793,9 +1018,12 @@ df_chunked = (
 )
 
 # Create a unique ID for every chunk (Critical for Vector Search)
-# Using MD5 hash of parent_id + chunk_index for deterministic IDs
+# Packing parent_id and chunk_index into one BIGINT gives deterministic IDs without
+# hashing; even the longest articles split into far fewer than 100,000 chunks
+CHUNKS_PER_PAGE: int = 100_000
 df_final = df_chunked.withColumn(
-    "chunk_id", md5(concat_ws("_", col("parent_id"), col("chunk_index")))
+    "chunk_id",
+    col("parent_id") * CHUNKS_PER_PAGE + col("chunk_index").cast("bigint"),
 )
 
 print("\nWriting chunks to Delta table...")
@@ -805,7 +1033,8 @@ df_final.write.format("delta").mode("overwrite").option(
     "overwriteSchema", "true"
 ).saveAsTable(chunks_table)
 
-chunk_count = spark.table(chunks_table).count()
+# COUNT(*) on a Delta table is answered from the transaction log without a scan
+chunk_count = spark.sql(f"SELECT COUNT(*) FROM {chunks_table}").first()[0]
 print(f"\n[OK] Chunks table created: {chunks_table}")
 print(f"[OK] Total chunks: {chunk_count:,}")
 
@@ -842,9 +1071,6 @@ from databricks.vector_search.client import VectorSearchClient
 # Initialize client
 vsc = VectorSearchClient()
 
-# Endpoint name
-endpoint_name: str = "wikipedia_vector_search_endpoint"
-
 print(f"Creating vector search endpoint: {endpoint_name}")
 
 try:
@@ -892,13 +1118,6 @@ while True:
 # DBTITLE 1,Create delta sync vector index
 from databricks.vector_search.client import VectorSearchClient
 
-# Get parameters
-catalog_name: str = dbutils.widgets.get("catalog")
-schema_name: str = dbutils.widgets.get("schema")
-chunks_table: str = f"{catalog_name}.{schema_name}.wikipedia_chunks"
-index_name: str = f"{catalog_name}.{schema_name}.wikipedia_chunks_index"
-endpoint_name: str = "wikipedia_vector_search_endpoint"
-
 # Initialize client
 vsc = VectorSearchClient()
 
@@ -936,12 +1155,12 @@ index = vsc.create_delta_sync_index(
     pipeline_type="TRIGGERED",  # Use TRIGGERED for manual sync (required for storage-optimized)
     primary_key="chunk_id",
     embedding_source_column="chunk_text",
-    embedding_model_endpoint_name="databricks-gte-large-en",  # Databricks foundation model
+    embedding_model_endpoint_name=embedding_endpoint,
 )
 
 print(f"\n[OK] Vector index created: {index_name}")
 print("[OK] Endpoint type: STORAGE_OPTIMIZED")
-print("[OK] Using embedding model: databricks-gte-large-en")
+print(f"[OK] Using embedding model: {embedding_endpoint}")
 print("[OK] Primary key: chunk_id")
 print("[OK] Embedding source: chunk_text")
 print("\nIndex will now sync data from the source table...")
@@ -953,26 +1172,42 @@ import time
 
 from databricks.vector_search.client import VectorSearchClient
 
-# Get parameters
-catalog_name: str = dbutils.widgets.get("catalog")
-schema_name: str = dbutils.widgets.get("schema")
-index_name: str = f"{catalog_name}.{schema_name}.wikipedia_chunks_index"
-endpoint_name: str = "wikipedia_vector_search_endpoint"
-
 # Initialize client
 vsc = VectorSearchClient(disable_notice=True)
 
 print(f"Monitoring index sync: {index_name}\n")
 
-# Check status periodically
+# Check status with exponential backoff: 5s, 10s, 20s, ... capped at 60s
 max_wait_minutes: int = 30
-check_interval_seconds: int = 30
-max_checks: int = (max_wait_minutes * 60) // check_interval_seconds
+initial_interval_seconds: int = 5
+max_interval_seconds: int = 60
+deadline: float = time.monotonic() + max_wait_minutes * 60
+
+# Index states while the sync is still in progress, and the state once it is done.
+# Any state ending in FAILED stops the loop.
+PENDING_STATES: frozenset[str] = frozenset(
+    {
+        "PROVISIONING",
+        "ONLINE_INDEXING",
+        "ONLINE_CONTINUOUS_UPDATE",
+        "PROVISIONING_INITIAL_SNAPSHOT",
+    }
+)
+READY_STATES: frozenset[str] = frozenset({"ONLINE_INDEXED"})
+
+# Resolve the index handle once and only describe() it on each check
+index = vsc.get_index(endpoint_name, index_name)
 
-for i in range(max_checks):
+check = 0
+while time.monotonic() < deadline:
+    check += 1
     try:
-        index = vsc.get_index(endpoint_name, index_name)
-        index_info = index.describe()  # Get dictionary from index object
+        try:
+            index_info = index.describe()  # Get dictionary from index object
+        except Exception:
+            # The handle may have gone stale; resolve it again and retry once
+            index = vsc.get_index(endpoint_name, index_name)
+            index_info = index.describe()
         status = index_info.get("status", {}).get("detailed_state", "UNKNOWN")
         ready = index_info.get("status", {}).get("ready", False)
 
@@ -980,13 +1215,13 @@ for i in range(max_checks):
         index_status = index_info.get("status", {})
         message = index_status.get("message", "")
 
-        print(f"Check {i + 1}/{max_checks}:")
+        print(f"Check {check}:")
         print(f"  State: {status}")
         print(f"  Ready: {ready}")
         if message:
             print(f"  Message: {message}")
 
-        if ready and status == "ONLINE_INDEXED":
+        if ready and status in READY_STATES:
             print("\n[OK] Index is ready and synced!")
 
             # Show index details
@@ -995,14 +1230,16 @@ for i in range(max_checks):
             print(f"  Index: {index_name}")
             print(f"  Status: {status}")
             break
-        elif status in [
-            "PROVISIONING",
-            "ONLINE_INDEXING",
-            "ONLINE_CONTINUOUS_UPDATE",
-            "PROVISIONING_INITIAL_SNAPSHOT",
-        ]:
-            print("  Waiting for sync to complete...\n")
-            time.sleep(check_interval_seconds)
+        elif status.endswith("FAILED"):
+            print(f"\n⚠ Index sync failed: {status}")
+            print(f"Full index info: {index_info}")
+            break
+        elif status in PENDING_STATES:
+            interval = min(
+                initial_interval_seconds * 2 ** (check - 1), max_interval_seconds
+            )
+            print(f"  Waiting {interval}s for sync to complete...\n")
+            time.sleep(min(interval, max(deadline - time.monotonic(), 0)))
         else:
             print(f"\n⚠ Unexpected status: {status}")
             print(f"Full index info: {index_info}")
@@ -1017,42 +1254,72 @@ else:
 # COMMAND ----------
 
 # DBTITLE 1,Test vector search
-from databricks.vector_search.client import VectorSearchClient
+import concurrent.futures
 
-# Get parameters
-catalog_name: str = dbutils.widgets.get("catalog")
-schema_name: str = dbutils.widgets.get("schema")
-index_name: str = f"{catalog_name}.{schema_name}.wikipedia_chunks_index"
-endpoint_name: str = "wikipedia_vector_search_endpoint"
+import pandas as pd
+from databricks.vector_search.client import VectorSearchClient
+from mlflow.deployments import get_deploy_client
 
 # Initialize client
 vsc = VectorSearchClient(disable_notice=True)
+index = vsc.get_index(endpoint_name, index_name)
 
 print(f"Testing vector search on index: {index_name}\n")
 
-# Test query
-test_query: str = "What is machine learning and artificial intelligence?"
+# Test queries
+test_queries: list[str] = [
+    "What is machine learning and artificial intelligence?",
+    "Who was the first person to walk on the moon?",
+    "How does photosynthesis work?",
+    "What caused the fall of the Roman Empire?",
+]
+
+# Embed the queries client-side, in one request, and keep the vectors across re-runs
+# of this cell so repeated queries skip the embedding step. embedding_endpoint is the
+# same model the index embeds its chunks with.
+query_embeddings: dict[str, list[float]] = globals().get("query_embeddings", {})
+missing_queries: list[str] = [q for q in test_queries if q not in query_embeddings]
+if missing_queries:
+    response = get_deploy_client("databricks").predict(
+        endpoint=embedding_endpoint, inputs={"input": missing_queries}
+    )
+    for query, item in zip(missing_queries, response["data"], strict=True):
+        query_embeddings[query] = item["embedding"]
+
+
+def search(query: str) -> dict:
+    return index.similarity_search(
+        query_vector=query_embeddings[query],
+        columns=["chunk_id", "parent_id", "title", "chunk_text", "chunk_index"],
+        num_results=5,
+    )
+
 
-print(f"Query: '{test_query}'\n")
-print("Searching for similar chunks...\n")
+# Run the searches concurrently so the wall-clock cost is about one round trip;
+# the SDK takes a single query per similarity_search call
+print(f"Searching for similar chunks for {len(test_queries)} queries...\n")
+with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+    all_results = list(executor.map(search, test_queries))
 
-# Perform similarity search
-results = vsc.get_index(endpoint_name, index_name).similarity_search(
-    query_text=test_query,
-    columns=["chunk_id", "parent_id", "title", "chunk_text", "chunk_index"],
-    num_results=5,
+# Collect the results into one DataFrame, naming columns from the response manifest
+# (chunk_id, parent_id, title, chunk_text, chunk_index, score)
+df_results = pd.concat(
+    [
+        pd.DataFrame(
+            results.get("result", {}).get("data_array", []),
+            columns=[c["name"] for c in results["manifest"]["columns"]],
+        ).assign(query=test_query, rank=lambda df: range(1, len(df) + 1))
+        for test_query, results in zip(test_queries, all_results, strict=True)
+    ],
+    ignore_index=True,
 )
+df_results["text_preview"] = df_results["chunk_text"].str.slice(0, 200)
 
-print("Top 5 most similar chunks:\n")
-print("=" * 80)
-
-for i, result in enumerate(results.get("result", {}).get("data_array", []), 1):
-    print(f"\nResult {i}:")
-    print(f"  Title: {result[2]}")
-    print(f"  Chunk ID: {result[0]}")
-    print(f"  Chunk Index: {result[4]}")
-    print(f"  Score: {result[-1]:.4f}")  # Last element is typically the score
-    print(f"  Text preview: {result[3][:200]}...")
-    print("-" * 80)
+print("Top 5 most similar chunks per query:\n")
+display(
+    df_results[
+        ["query", "rank", "title", "chunk_id", "chunk_index", "score", "text_preview"]
+    ]
+)
 
 print("\n[OK] Vector search test complete!")
@@ -49,25 +49,78 @@ print(f"Using schema: {schema}")
 # MAGIC )
 # MAGIC RETURNS STRING
 # MAGIC LANGUAGE PYTHON
+# MAGIC PARAMETER STYLE PANDAS
+# MAGIC HANDLER 'handler'
 # MAGIC ENVIRONMENT (
-# MAGIC   dependencies = '["yfinance"]',
+# MAGIC   dependencies = '["yfinance", "cachetools", "orjson"]',
 # MAGIC   environment_version = 'None'
 # MAGIC )
 # MAGIC COMMENT 'Get comprehensive stock information from Yahoo Finance including company details, market cap, P/E ratio, sector, and more'
 # MAGIC AS $$
+# MAGIC import threading
+# MAGIC from concurrent.futures import ThreadPoolExecutor
+# MAGIC from typing import Iterator
+# MAGIC
+# MAGIC import orjson
+# MAGIC import pandas as pd
 # MAGIC import yfinance as yf
-# MAGIC import json
+# MAGIC from cachetools import TTLCache
+# MAGIC
+# MAGIC
+# MAGIC # Yahoo Finance requests are I/O bound, so distinct symbols in a batch are fetched
+# MAGIC # concurrently on a thread pool kept for the lifetime of this Python worker
+# MAGIC MAX_WORKERS = 16
+# MAGIC executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+# MAGIC
+# MAGIC
+# MAGIC def dumps(obj):
+# MAGIC     # orjson encodes numpy scalars and arrays natively, and NaN as null
+# MAGIC     return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode("utf-8")
+# MAGIC
+# MAGIC
+# MAGIC # Ticker objects live for the lifetime of this Python worker, so repeated symbols
+# MAGIC # across rows and batches share yfinance's session and crumb. yfinance memoizes
+# MAGIC # some properties on the Ticker itself, so entries expire after a minute.
+# MAGIC tickers = TTLCache(maxsize=1024, ttl=60)
+# MAGIC
+# MAGIC # Stock info is cached for a minute as well; it is the slowest call to make
+# MAGIC infos = TTLCache(maxsize=1024, ttl=60)
+# MAGIC
+# MAGIC # TTLCache is not thread-safe; the lock guards cache access, not the fetches
+# MAGIC cache_lock = threading.Lock()
+# MAGIC
+# MAGIC
+# MAGIC def get_ticker(symbol):
+# MAGIC     with cache_lock:
+# MAGIC         ticker = tickers.get(symbol)
+# MAGIC         if ticker is None:
+# MAGIC             ticker = tickers[symbol] = yf.Ticker(symbol)
+# MAGIC         return ticker
 # MAGIC
-# MAGIC try:
-# MAGIC     ticker = yf.Ticker(symbol)
-# MAGIC     info = ticker.info
 # MAGIC
-# MAGIC     if not info or info.get("regularMarketPrice") is None:
-# MAGIC         return json.dumps({"error": f"No data found for symbol: {symbol}"})
+# MAGIC def get_stock_info(symbol):
+# MAGIC     try:
+# MAGIC         with cache_lock:
+# MAGIC             info = infos.get(symbol)
+# MAGIC         if info is None:
+# MAGIC             info = get_ticker(symbol).info
+# MAGIC             with cache_lock:
+# MAGIC                 infos[symbol] = info
 # MAGIC
-# MAGIC     return json.dumps(info)
-# MAGIC except Exception as e:
-# MAGIC     return json.dumps({"error": "Request failed", "message": str(e)})
+# MAGIC         if not info or info.get("regularMarketPrice") is None:
+# MAGIC             return dumps({"error": f"No data found for symbol: {symbol}"})
+# MAGIC
+# MAGIC         return dumps(info)
+# MAGIC     except Exception as e:
+# MAGIC         return dumps({"error": "Request failed", "message": str(e)})
+# MAGIC
+# MAGIC
+# MAGIC def handler(batch_iter: Iterator[pd.Series]) -> Iterator[pd.Series]:
+# MAGIC     for symbols in batch_iter:
+# MAGIC         # Duplicate symbols within a batch share a single fetch
+# MAGIC         unique = list(dict.fromkeys(symbols))
+# MAGIC         results = dict(zip(unique, executor.map(get_stock_info, unique)))
+# MAGIC         yield pd.Series([results[symbol] for symbol in symbols])
 # MAGIC $$;
 
 # COMMAND ----------
@@ -79,6 +132,75 @@ display(result_df)
 
 # COMMAND ----------
 
+# DBTITLE 1,Create table function to get structured stock info
+# MAGIC %sql
+# MAGIC -- Create UC table function returning the key stock info fields as typed columns,
+# MAGIC -- without a JSON round trip through get_stock_info and from_json
+# MAGIC CREATE OR REPLACE FUNCTION get_stock_info_structured(
+# MAGIC   symbol STRING COMMENT 'Stock ticker symbol (e.g., AAPL, MSFT, GOOGL)'
+# MAGIC )
+# MAGIC RETURNS TABLE (
+# MAGIC   company_name STRING,
+# MAGIC   sector STRING,
+# MAGIC   industry STRING,
+# MAGIC   market_cap BIGINT,
+# MAGIC   current_price DOUBLE,
+# MAGIC   pe_ratio DOUBLE,
+# MAGIC   dividend_yield DOUBLE,
+# MAGIC   high_52w DOUBLE,
+# MAGIC   low_52w DOUBLE
+# MAGIC )
+# MAGIC LANGUAGE PYTHON
+# MAGIC HANDLER 'StockInfo'
+# MAGIC ENVIRONMENT (
+# MAGIC   dependencies = '["yfinance", "cachetools"]',
+# MAGIC   environment_version = 'None'
+# MAGIC )
+# MAGIC COMMENT 'Get key stock information (company, sector, market cap, price, P/E ratio, dividend yield and 52 week range) as typed columns. Returns no rows when no data is found; use get_stock_info for error details'
+# MAGIC AS $$
+# MAGIC import yfinance as yf
+# MAGIC from cachetools import TTLCache
+# MAGIC
+# MAGIC # Stock info lives for a minute in this Python worker, so repeated symbols skip the network
+# MAGIC infos = TTLCache(maxsize=1024, ttl=60)
+# MAGIC
+# MAGIC
+# MAGIC def as_float(value):
+# MAGIC     return float(value) if isinstance(value, (int, float)) else None
+# MAGIC
+# MAGIC
+# MAGIC def as_int(value):
+# MAGIC     return int(value) if isinstance(value, (int, float)) else None
+# MAGIC
+# MAGIC
+# MAGIC class StockInfo:
+# MAGIC     def eval(self, symbol):
+# MAGIC         # Typed rows have nowhere to put an error message, so failures return no rows
+# MAGIC         try:
+# MAGIC             info = infos.get(symbol)
+# MAGIC             if info is None:
+# MAGIC                 info = infos[symbol] = yf.Ticker(symbol).info
+# MAGIC         except Exception:
+# MAGIC             return
+# MAGIC
+# MAGIC         if not info or info.get("regularMarketPrice") is None:
+# MAGIC             return
+# MAGIC
+# MAGIC         yield (
+# MAGIC             info.get("shortName"),
+# MAGIC             info.get("sector"),
+# MAGIC             info.get("industry"),
+# MAGIC             as_int(info.get("marketCap")),
+# MAGIC             as_float(info.get("currentPrice")),
+# MAGIC             as_float(info.get("trailingPE")),
+# MAGIC             as_float(info.get("dividendYield")),
+# MAGIC             as_float(info.get("fiftyTwoWeekHigh")),
+# MAGIC             as_float(info.get("fiftyTwoWeekLow")),
+# MAGIC         )
+# MAGIC $$;
+
+# COMMAND ----------
+
 # DBTITLE 1,Create function to get stock history
 # MAGIC %sql
 # MAGIC -- Create UC Function to get historical stock data
@@ -89,48 +211,263 @@ display(result_df)
 # MAGIC )
 # MAGIC RETURNS STRING
 # MAGIC LANGUAGE PYTHON
+# MAGIC PARAMETER STYLE PANDAS
+# MAGIC HANDLER 'handler'
 # MAGIC ENVIRONMENT (
-# MAGIC   dependencies = '["yfinance"]',
+# MAGIC   dependencies = '["yfinance", "cachetools", "orjson"]',
 # MAGIC   environment_version = 'None'
 # MAGIC )
 # MAGIC COMMENT 'Get historical OHLCV (Open, High, Low, Close, Volume) data for a stock'
 # MAGIC AS $$
+# MAGIC from typing import Iterator, Tuple
+# MAGIC
+# MAGIC import orjson
+# MAGIC import pandas as pd
 # MAGIC import yfinance as yf
-# MAGIC import json
+# MAGIC from cachetools import TTLCache
 # MAGIC
-# MAGIC try:
-# MAGIC     ticker = yf.Ticker(symbol)
-# MAGIC     hist = ticker.history(period=period, interval=interval_val)
+# MAGIC # ISO 8601 timestamps with UTC offset, as returned by the MCP server
+# MAGIC DATE_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
+# MAGIC
+# MAGIC
+# MAGIC def dumps(obj):
+# MAGIC     # orjson encodes numpy scalars and arrays natively, and NaN as null
+# MAGIC     return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode("utf-8")
 # MAGIC
-# MAGIC     if hist.empty:
-# MAGIC         return json.dumps({"error": f"No historical data found for symbol: {symbol}"})
 # MAGIC
-# MAGIC     # Reset index to include date as a column and convert to JSON-serializable format
-# MAGIC     hist = hist.reset_index()
-# MAGIC     hist["Date"] = hist["Date"].astype(str)
+# MAGIC # Ticker objects live for the lifetime of this Python worker, so repeated symbols
+# MAGIC # across rows and batches share yfinance's session and crumb. yfinance memoizes
+# MAGIC # some properties on the Ticker itself, so entries expire after a minute.
+# MAGIC tickers = TTLCache(maxsize=1024, ttl=60)
 # MAGIC
-# MAGIC     # Convert to list of records
-# MAGIC     records = hist.to_dict(orient="records")
 # MAGIC
-# MAGIC     return json.dumps({
+# MAGIC def get_ticker(symbol):
+# MAGIC     ticker = tickers.get(symbol)
+# MAGIC     if ticker is None:
+# MAGIC         ticker = tickers[symbol] = yf.Ticker(symbol)
+# MAGIC     return ticker
+# MAGIC
+# MAGIC
+# MAGIC def get_stock_history(symbol, period, interval_val):
+# MAGIC     try:
+# MAGIC         hist = get_ticker(symbol).history(period=period, interval=interval_val)
+# MAGIC
+# MAGIC         if hist.empty:
+# MAGIC             return dumps({"error": f"No historical data found for symbol: {symbol}"})
+# MAGIC
+# MAGIC         # Format the index as a leading Date column in one vectorized pass. The index is
+# MAGIC         # named Datetime for intraday intervals, so it is renamed rather than read by name
+# MAGIC         hist = hist.set_axis(hist.index.strftime(DATE_FORMAT)).rename_axis("Date").reset_index()
+# MAGIC
+# MAGIC         # Convert to one list per column, which avoids boxing every cell into a record dict
+# MAGIC         return dumps({
+# MAGIC             "symbol": symbol,
+# MAGIC             "period": period,
+# MAGIC             "interval": interval_val,
+# MAGIC             "columns": list(hist.columns),
+# MAGIC             "data": hist.to_dict(orient="list")
+# MAGIC         })
+# MAGIC     except Exception as e:
+# MAGIC         return dumps({"error": "Request failed", "message": str(e)})
+# MAGIC
+# MAGIC
+# MAGIC def handler(batch_iter: Iterator[Tuple[pd.Series, pd.Series, pd.Series]]) -> Iterator[pd.Series]:
+# MAGIC     for symbols, periods, intervals in batch_iter:
+# MAGIC         yield pd.Series([get_stock_history(*row) for row in zip(symbols, periods, intervals)])
+# MAGIC $$;
+
+# COMMAND ----------
+
+# DBTITLE 1,Test get_stock_history
+# Test the get_stock_history function
+result_df = spark.sql("SELECT get_stock_history('MSFT', '5d', '1d') AS history")
+display(result_df)
+
+# COMMAND ----------
+
+# DBTITLE 1,Create function to get stock history for many symbols
+# MAGIC %sql
+# MAGIC -- Create UC Function to get historical stock data for many rows with batched downloads
+# MAGIC CREATE OR REPLACE FUNCTION get_stock_history_batch(
+# MAGIC   symbol STRING COMMENT 'Stock ticker symbol (e.g., AAPL, MSFT, GOOGL)',
+# MAGIC   period STRING COMMENT 'Data period: 1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, 10y, ytd, max',
+# MAGIC   interval_val STRING COMMENT 'Data interval: 1m, 2m, 5m, 15m, 30m, 60m, 90m, 1h, 1d, 5d, 1wk, 1mo, 3mo'
+# MAGIC )
+# MAGIC RETURNS STRING
+# MAGIC LANGUAGE PYTHON
+# MAGIC PARAMETER STYLE PANDAS
+# MAGIC HANDLER 'handler'
+# MAGIC ENVIRONMENT (
+# MAGIC   dependencies = '["yfinance", "orjson"]',
+# MAGIC   environment_version = 'None'
+# MAGIC )
+# MAGIC COMMENT 'Get historical OHLCV data for a stock, downloading all symbols in a batch that share a period and interval together. Prefer over get_stock_history when querying many symbols'
+# MAGIC AS $$
+# MAGIC from typing import Iterator, Tuple
+# MAGIC
+# MAGIC import orjson
+# MAGIC import pandas as pd
+# MAGIC import yfinance as yf
+# MAGIC
+# MAGIC # ISO 8601 timestamps with UTC offset, as returned by the MCP server
+# MAGIC DATE_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
+# MAGIC
+# MAGIC
+# MAGIC def dumps(obj):
+# MAGIC     # orjson encodes numpy scalars and arrays natively, and NaN as null
+# MAGIC     return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode("utf-8")
+# MAGIC
+# MAGIC
+# MAGIC
+# MAGIC def to_json(symbol, period, interval_val, hist):
+# MAGIC     if hist is None or hist.empty:
+# MAGIC         return dumps({"error": f"No historical data found for symbol: {symbol}"})
+# MAGIC
+# MAGIC     # Format the index as a leading Date column in one vectorized pass. The index is
+# MAGIC     # named Datetime for intraday intervals, so it is renamed rather than read by name
+# MAGIC     hist = hist.set_axis(hist.index.strftime(DATE_FORMAT)).rename_axis("Date").reset_index()
+# MAGIC
+# MAGIC     # Convert to one list per column, which avoids boxing every cell into a record dict
+# MAGIC     return dumps({
 # MAGIC         "symbol": symbol,
 # MAGIC         "period": period,
 # MAGIC         "interval": interval_val,
-# MAGIC         "data": records
+# MAGIC         "columns": list(hist.columns),
+# MAGIC         "data": hist.to_dict(orient="list")
 # MAGIC     })
-# MAGIC except Exception as e:
-# MAGIC     return json.dumps({"error": "Request failed", "message": str(e)})
+# MAGIC
+# MAGIC
+# MAGIC def download(symbols, period, interval_val):
+# MAGIC     # yfinance upper-cases symbols and fetches them on its own thread pool
+# MAGIC     data = yf.download(
+# MAGIC         tickers=symbols,
+# MAGIC         period=period,
+# MAGIC         interval=interval_val,
+# MAGIC         group_by="ticker",
+# MAGIC         threads=True,
+# MAGIC         progress=False,
+# MAGIC     )
+# MAGIC
+# MAGIC     results = {}
+# MAGIC     for symbol in symbols:
+# MAGIC         if data is None or data.empty:
+# MAGIC             hist = None
+# MAGIC         elif data.columns.nlevels > 1:
+# MAGIC             hist = data[symbol.upper()] if symbol.upper() in data.columns.get_level_values(0) else None
+# MAGIC         else:
+# MAGIC             hist = data
+# MAGIC         if hist is not None:
+# MAGIC             hist = hist.dropna(how="all")
+# MAGIC         results[symbol] = to_json(symbol, period, interval_val, hist)
+# MAGIC     return results
+# MAGIC
+# MAGIC
+# MAGIC def handler(batch_iter: Iterator[Tuple[pd.Series, pd.Series, pd.Series]]) -> Iterator[pd.Series]:
+# MAGIC     for symbols, periods, intervals in batch_iter:
+# MAGIC         rows = pd.DataFrame({"symbol": symbols, "period": periods, "interval": intervals})
+# MAGIC         results = {}
+# MAGIC         # One download per (period, interval) covering every distinct symbol that uses it
+# MAGIC         for (period, interval_val), group in rows.dropna().groupby(["period", "interval"]):
+# MAGIC             unique = list(dict.fromkeys(group["symbol"]))
+# MAGIC             try:
+# MAGIC                 downloaded = download(unique, period, interval_val)
+# MAGIC             except Exception as e:
+# MAGIC                 error = dumps({"error": "Request failed", "message": str(e)})
+# MAGIC                 downloaded = dict.fromkeys(unique, error)
+# MAGIC             for symbol, result in downloaded.items():
+# MAGIC                 results[(symbol, period, interval_val)] = result
+# MAGIC         yield pd.Series([results.get(row) for row in zip(symbols, periods, intervals)])
 # MAGIC $$;
 
 # COMMAND ----------
 
-# DBTITLE 1,Test get_stock_history
-# Test the get_stock_history function
-result_df = spark.sql("SELECT get_stock_history('MSFT', '5d', '1d') AS history")
+# DBTITLE 1,Test get_stock_history_batch
+# Test the get_stock_history_batch function over several symbols at once
+result_df = spark.sql("""
+  SELECT symbol, get_stock_history_batch(symbol, '5d', '1d') AS history
+  FROM VALUES ('AAPL'), ('MSFT'), ('GOOGL'), ('NVDA') AS portfolio(symbol)
+""")
 display(result_df)
 
 # COMMAND ----------
 
+# DBTITLE 1,Create function to get typed stock prices
+# MAGIC %sql
+# MAGIC -- Create UC Function returning historical stock data as typed values, so callers can
+# MAGIC -- use the prices directly without parsing JSON
+# MAGIC CREATE OR REPLACE FUNCTION get_stock_prices(
+# MAGIC   symbol STRING COMMENT 'Stock ticker symbol (e.g., AAPL, MSFT, GOOGL)',
+# MAGIC   period STRING COMMENT 'Data period: 1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, 10y, ytd, max',
+# MAGIC   interval_val STRING COMMENT 'Data interval: 1m, 2m, 5m, 15m, 30m, 60m, 90m, 1h, 1d, 5d, 1wk, 1mo, 3mo'
+# MAGIC )
+# MAGIC RETURNS ARRAY<STRUCT<date: STRING, open: DOUBLE, high: DOUBLE, low: DOUBLE, close: DOUBLE, volume: BIGINT>>
+# MAGIC LANGUAGE PYTHON
+# MAGIC PARAMETER STYLE PANDAS
+# MAGIC HANDLER 'handler'
+# MAGIC ENVIRONMENT (
+# MAGIC   dependencies = '["yfinance", "cachetools"]',
+# MAGIC   environment_version = 'None'
+# MAGIC )
+# MAGIC COMMENT 'Get historical OHLCV data for a stock as an array of structs. Returns NULL when no data is found; use get_stock_history for error details'
+# MAGIC AS $$
+# MAGIC from typing import Iterator, Tuple
+# MAGIC
+# MAGIC import pandas as pd
+# MAGIC import yfinance as yf
+# MAGIC from cachetools import TTLCache
+# MAGIC
+# MAGIC # ISO 8601 timestamps with UTC offset, as returned by the MCP server
+# MAGIC DATE_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
+# MAGIC
+# MAGIC # Ticker objects live for the lifetime of this Python worker, so repeated symbols
+# MAGIC # across rows and batches share yfinance's session and crumb. yfinance memoizes
+# MAGIC # some properties on the Ticker itself, so entries expire after a minute.
+# MAGIC tickers = TTLCache(maxsize=1024, ttl=60)
+# MAGIC
+# MAGIC
+# MAGIC def get_ticker(symbol):
+# MAGIC     ticker = tickers.get(symbol)
+# MAGIC     if ticker is None:
+# MAGIC         ticker = tickers[symbol] = yf.Ticker(symbol)
+# MAGIC     return ticker
+# MAGIC
+# MAGIC
+# MAGIC def get_stock_prices(symbol, period, interval_val):
+# MAGIC     # Typed results have nowhere to put an error message, so failures return NULL
+# MAGIC     try:
+# MAGIC         hist = get_ticker(symbol).history(period=period, interval=interval_val)
+# MAGIC     except Exception:
+# MAGIC         return None
+# MAGIC
+# MAGIC     if hist.empty:
+# MAGIC         return None
+# MAGIC
+# MAGIC     prices = pd.DataFrame({
+# MAGIC         "date": hist.index.strftime(DATE_FORMAT),
+# MAGIC         "open": hist["Open"].to_numpy(),
+# MAGIC         "high": hist["High"].to_numpy(),
+# MAGIC         "low": hist["Low"].to_numpy(),
+# MAGIC         "close": hist["Close"].to_numpy(),
+# MAGIC         "volume": hist["Volume"].fillna(0).astype("int64").to_numpy(),
+# MAGIC     })
+# MAGIC     return prices.to_dict(orient="records")
+# MAGIC
+# MAGIC
+# MAGIC def handler(batch_iter: Iterator[Tuple[pd.Series, pd.Series, pd.Series]]) -> Iterator[pd.Series]:
+# MAGIC     for symbols, periods, intervals in batch_iter:
+# MAGIC         yield pd.Series([get_stock_prices(*row) for row in zip(symbols, periods, intervals)])
+# MAGIC $$;
+
+# COMMAND ----------
+
+# DBTITLE 1,Test get_stock_prices
+# MAGIC %sql
+# MAGIC -- Test the get_stock_prices function, one row per trading day
+# MAGIC SELECT price.*
+# MAGIC FROM (SELECT explode(get_stock_prices('MSFT', '5d', '1d')) AS price)
+
+# COMMAND ----------
+
 # DBTITLE 1,Create function to get financials
 # MAGIC %sql
 # MAGIC -- Create UC Function to get financial statements
@@ -140,41 +477,77 @@ display(result_df)
 # MAGIC )
 # MAGIC RETURNS STRING
 # MAGIC LANGUAGE PYTHON
+# MAGIC PARAMETER STYLE PANDAS
+# MAGIC HANDLER 'handler'
 # MAGIC ENVIRONMENT (
-# MAGIC   dependencies = '["yfinance"]',
+# MAGIC   dependencies = '["yfinance", "cachetools", "orjson"]',
 # MAGIC   environment_version = 'None'
 # MAGIC )
 # MAGIC COMMENT 'Get financial statements (income statement, balance sheet, or cash flow) for a company'
 # MAGIC AS $$
+# MAGIC from operator import attrgetter
+# MAGIC from typing import Iterator, Tuple
+# MAGIC
+# MAGIC import orjson
+# MAGIC import pandas as pd
 # MAGIC import yfinance as yf
-# MAGIC import json
+# MAGIC from cachetools import TTLCache
 # MAGIC
-# MAGIC try:
-# MAGIC     ticker = yf.Ticker(symbol)
 # MAGIC
-# MAGIC     if statement_type == "income":
-# MAGIC         df = ticker.financials
-# MAGIC     elif statement_type == "balance":
-# MAGIC         df = ticker.balance_sheet
-# MAGIC     elif statement_type == "cashflow":
-# MAGIC         df = ticker.cashflow
-# MAGIC     else:
-# MAGIC         return json.dumps({"error": f"Invalid statement_type: {statement_type}. Use 'income', 'balance', or 'cashflow'"})
+# MAGIC def dumps(obj):
+# MAGIC     # orjson encodes numpy scalars and arrays natively, and NaN as null
+# MAGIC     return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode("utf-8")
 # MAGIC
-# MAGIC     if df is None or df.empty:
-# MAGIC         return json.dumps({"error": f"No financial data found for symbol: {symbol}"})
 # MAGIC
-# MAGIC     # Convert column names (dates) to strings and transpose for better readability
-# MAGIC     df.columns = df.columns.astype(str)
-# MAGIC     result = df.to_dict()
+# MAGIC # Ticker objects live for the lifetime of this Python worker, so repeated symbols
+# MAGIC # across rows and batches share yfinance's session and crumb. yfinance memoizes
+# MAGIC # some properties on the Ticker itself, so entries expire after a minute.
+# MAGIC tickers = TTLCache(maxsize=1024, ttl=60)
 # MAGIC
-# MAGIC     return json.dumps({
-# MAGIC         "symbol": symbol,
-# MAGIC         "statement_type": statement_type,
-# MAGIC         "data": result
-# MAGIC     })
-# MAGIC except Exception as e:
-# MAGIC     return json.dumps({"error": "Request failed", "message": str(e)})
+# MAGIC
+# MAGIC def get_ticker(symbol):
+# MAGIC     ticker = tickers.get(symbol)
+# MAGIC     if ticker is None:
+# MAGIC         ticker = tickers[symbol] = yf.Ticker(symbol)
+# MAGIC     return ticker
+# MAGIC
+# MAGIC
+# MAGIC # Ticker accessors for each supported statement_type. Only the requested statement
+# MAGIC # is fetched, as each accessor makes its own request
+# MAGIC STATEMENTS = {
+# MAGIC     "income": attrgetter("financials"),
+# MAGIC     "balance": attrgetter("balance_sheet"),
+# MAGIC     "cashflow": attrgetter("cashflow"),
+# MAGIC }
+# MAGIC
+# MAGIC
+# MAGIC def get_financials(symbol, statement_type):
+# MAGIC     # Reject unknown (or NULL) statement types before touching the network
+# MAGIC     getter = STATEMENTS.get(statement_type)
+# MAGIC     if getter is None:
+# MAGIC         return dumps({"error": f"Invalid statement_type: {statement_type}. Use 'income', 'balance', or 'cashflow'"})
+# MAGIC
+# MAGIC     try:
+# MAGIC         df = getter(get_ticker(symbol))
+# MAGIC
+# MAGIC         if df is None or df.empty:
+# MAGIC             return dumps({"error": f"No financial data found for symbol: {symbol}"})
+# MAGIC
+# MAGIC         # Convert column names (dates) to strings; copy first, as yfinance memoizes df on the Ticker
+# MAGIC         result = df.set_axis(df.columns.astype(str), axis=1).to_dict()
+# MAGIC
+# MAGIC         return dumps({
+# MAGIC             "symbol": symbol,
+# MAGIC             "statement_type": statement_type,
+# MAGIC             "data": result
+# MAGIC         })
+# MAGIC     except Exception as e:
+# MAGIC         return dumps({"error": "Request failed", "message": str(e)})
+# MAGIC
+# MAGIC
+# MAGIC def handler(batch_iter: Iterator[Tuple[pd.Series, pd.Series]]) -> Iterator[pd.Series]:
+# MAGIC     for symbols, statement_types in batch_iter:
+# MAGIC         yield pd.Series([get_financials(*row) for row in zip(symbols, statement_types)])
 # MAGIC $$;
 
 # COMMAND ----------
@@ -195,35 +568,68 @@ display(result_df)
 # MAGIC )
 # MAGIC RETURNS STRING
 # MAGIC LANGUAGE PYTHON
+# MAGIC PARAMETER STYLE PANDAS
+# MAGIC HANDLER 'handler'
 # MAGIC ENVIRONMENT (
-# MAGIC   dependencies = '["yfinance"]',
+# MAGIC   dependencies = '["yfinance", "cachetools", "orjson"]',
 # MAGIC   environment_version = 'None'
 # MAGIC )
 # MAGIC COMMENT 'Get analyst recommendations and ratings for a stock'
 # MAGIC AS $$
+# MAGIC from typing import Iterator
+# MAGIC
+# MAGIC import orjson
+# MAGIC import pandas as pd
 # MAGIC import yfinance as yf
-# MAGIC import json
+# MAGIC from cachetools import TTLCache
 # MAGIC
-# MAGIC try:
-# MAGIC     ticker = yf.Ticker(symbol)
-# MAGIC     recommendations = ticker.recommendations
+# MAGIC # ISO 8601 timestamps with UTC offset, as returned by the MCP server
+# MAGIC DATE_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
 # MAGIC
-# MAGIC     if recommendations is None or recommendations.empty:
-# MAGIC         return json.dumps({"error": f"No recommendations found for symbol: {symbol}"})
 # MAGIC
-# MAGIC     # Reset index and convert to JSON-serializable format
-# MAGIC     recommendations = recommendations.reset_index()
-# MAGIC     if "Date" in recommendations.columns:
-# MAGIC         recommendations["Date"] = recommendations["Date"].astype(str)
+# MAGIC def dumps(obj):
+# MAGIC     # orjson encodes numpy scalars and arrays natively, and NaN as null
+# MAGIC     return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode("utf-8")
 # MAGIC
-# MAGIC     records = recommendations.to_dict(orient="records")
 # MAGIC
-# MAGIC     return json.dumps({
-# MAGIC         "symbol": symbol,
-# MAGIC         "recommendations": records
-# MAGIC     })
-# MAGIC except Exception as e:
-# MAGIC     return json.dumps({"error": "Request failed", "message": str(e)})
+# MAGIC # Ticker objects live for the lifetime of this Python worker, so repeated symbols
+# MAGIC # across rows and batches share yfinance's session and crumb. yfinance memoizes
+# MAGIC # some properties on the Ticker itself, so entries expire after a minute.
+# MAGIC tickers = TTLCache(maxsize=1024, ttl=60)
+# MAGIC
+# MAGIC
+# MAGIC def get_ticker(symbol):
+# MAGIC     ticker = tickers.get(symbol)
+# MAGIC     if ticker is None:
+# MAGIC         ticker = tickers[symbol] = yf.Ticker(symbol)
+# MAGIC     return ticker
+# MAGIC
+# MAGIC
+# MAGIC def get_recommendations(symbol):
+# MAGIC     try:
+# MAGIC         recommendations = get_ticker(symbol).recommendations
+# MAGIC
+# MAGIC         if recommendations is None or recommendations.empty:
+# MAGIC             return dumps({"error": f"No recommendations found for symbol: {symbol}"})
+# MAGIC
+# MAGIC         # Format a date index as a leading Date column in one vectorized pass
+# MAGIC         if isinstance(recommendations.index, pd.DatetimeIndex):
+# MAGIC             dates = recommendations.index.strftime(DATE_FORMAT)
+# MAGIC             recommendations = recommendations.set_axis(dates).rename_axis("Date").reset_index()
+# MAGIC
+# MAGIC         # Convert to one list per column, which avoids boxing every cell into a record dict
+# MAGIC         return dumps({
+# MAGIC             "symbol": symbol,
+# MAGIC             "columns": list(recommendations.columns),
+# MAGIC             "recommendations": recommendations.to_dict(orient="list")
+# MAGIC         })
+# MAGIC     except Exception as e:
+# MAGIC         return dumps({"error": "Request failed", "message": str(e)})
+# MAGIC
+# MAGIC
+# MAGIC def handler(batch_iter: Iterator[pd.Series]) -> Iterator[pd.Series]:
+# MAGIC     for symbols in batch_iter:
+# MAGIC         yield symbols.map(get_recommendations)
 # MAGIC $$;
 
 # COMMAND ----------
@@ -243,34 +649,64 @@ display(result_df)
 # MAGIC )
 # MAGIC RETURNS STRING
 # MAGIC LANGUAGE PYTHON
+# MAGIC PARAMETER STYLE PANDAS
+# MAGIC HANDLER 'handler'
 # MAGIC ENVIRONMENT (
-# MAGIC   dependencies = '["yfinance"]',
+# MAGIC   dependencies = '["yfinance", "cachetools", "orjson"]',
 # MAGIC   environment_version = 'None'
 # MAGIC )
 # MAGIC COMMENT 'Get dividend payment history for a stock'
 # MAGIC AS $$
+# MAGIC from typing import Iterator
+# MAGIC
+# MAGIC import orjson
+# MAGIC import pandas as pd
 # MAGIC import yfinance as yf
-# MAGIC import json
+# MAGIC from cachetools import TTLCache
 # MAGIC
-# MAGIC try:
-# MAGIC     ticker = yf.Ticker(symbol)
-# MAGIC     dividends = ticker.dividends
 # MAGIC
-# MAGIC     if dividends is None or dividends.empty:
-# MAGIC         return json.dumps({"error": f"No dividend data found for symbol: {symbol}"})
+# MAGIC def dumps(obj):
+# MAGIC     # orjson encodes numpy scalars and arrays natively, and NaN as null
+# MAGIC     return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode("utf-8")
 # MAGIC
-# MAGIC     # Convert to list of records with date and dividend amount
-# MAGIC     records = [
-# MAGIC         {"date": str(date), "dividend": float(value)}
-# MAGIC         for date, value in dividends.items()
-# MAGIC     ]
 # MAGIC
-# MAGIC     return json.dumps({
-# MAGIC         "symbol": symbol,
-# MAGIC         "dividends": records
-# MAGIC     })
-# MAGIC except Exception as e:
-# MAGIC     return json.dumps({"error": "Request failed", "message": str(e)})
+# MAGIC # Ticker objects live for the lifetime of this Python worker, so repeated symbols
+# MAGIC # across rows and batches share yfinance's session and crumb. yfinance memoizes
+# MAGIC # some properties on the Ticker itself, so entries expire after a minute.
+# MAGIC tickers = TTLCache(maxsize=1024, ttl=60)
+# MAGIC
+# MAGIC
+# MAGIC def get_ticker(symbol):
+# MAGIC     ticker = tickers.get(symbol)
+# MAGIC     if ticker is None:
+# MAGIC         ticker = tickers[symbol] = yf.Ticker(symbol)
+# MAGIC     return ticker
+# MAGIC
+# MAGIC
+# MAGIC def get_dividends(symbol):
+# MAGIC     try:
+# MAGIC         dividends = get_ticker(symbol).dividends
+# MAGIC
+# MAGIC         if dividends is None or dividends.empty:
+# MAGIC             return dumps({"error": f"No dividend data found for symbol: {symbol}"})
+# MAGIC
+# MAGIC         # Convert to list of records with date and dividend amount
+# MAGIC         records = [
+# MAGIC             {"date": str(date), "dividend": float(value)}
+# MAGIC             for date, value in dividends.items()
+# MAGIC         ]
+# MAGIC
+# MAGIC         return dumps({
+# MAGIC             "symbol": symbol,
+# MAGIC             "dividends": records
+# MAGIC         })
+# MAGIC     except Exception as e:
+# MAGIC         return dumps({"error": "Request failed", "message": str(e)})
+# MAGIC
+# MAGIC
+# MAGIC def handler(batch_iter: Iterator[pd.Series]) -> Iterator[pd.Series]:
+# MAGIC     for symbols in batch_iter:
+# MAGIC         yield symbols.map(get_dividends)
 # MAGIC $$;
 
 # COMMAND ----------
@@ -307,25 +743,11 @@ display(result_df)
 
 # COMMAND ----------
 
-# DBTITLE 1,Parse JSON example
+# DBTITLE 1,Structured stock info example
 # MAGIC %sql
-# MAGIC -- Example: Parse stock info JSON into structured columns
-# MAGIC SELECT
-# MAGIC   json_data.shortName AS company_name,
-# MAGIC   json_data.sector AS sector,
-# MAGIC   json_data.industry AS industry,
-# MAGIC   json_data.marketCap AS market_cap,
-# MAGIC   json_data.currentPrice AS current_price,
-# MAGIC   json_data.trailingPE AS pe_ratio,
-# MAGIC   json_data.dividendYield AS dividend_yield,
-# MAGIC   json_data.fiftyTwoWeekHigh AS high_52w,
-# MAGIC   json_data.fiftyTwoWeekLow AS low_52w
-# MAGIC FROM (
-# MAGIC   SELECT from_json(
-# MAGIC     get_stock_info('AAPL'),
-# MAGIC     'STRUCT<shortName:STRING, sector:STRING, industry:STRING, marketCap:BIGINT, currentPrice:DOUBLE, trailingPE:DOUBLE, dividendYield:DOUBLE, fiftyTwoWeekHigh:DOUBLE, fiftyTwoWeekLow:DOUBLE>'
-# MAGIC   ) AS json_data
-# MAGIC )
+# MAGIC -- Example: Get stock info as structured columns, one row per symbol
+# MAGIC SELECT *
+# MAGIC FROM get_stock_info_structured('AAPL')
 
 # COMMAND ----------
 
@@ -347,23 +769,36 @@ display(result_df)
 # MAGIC 1. **get_stock_info(symbol)** - Get comprehensive stock information
 # MAGIC    * `symbol` (STRING) - Stock ticker symbol (e.g., AAPL, MSFT)
 # MAGIC    * Returns: JSON with company details, market cap, P/E ratio, sector, industry, etc.
+# MAGIC    * Distinct symbols in a batch are fetched concurrently, so prefer `SELECT get_stock_info(symbol) FROM portfolio` over looping per symbol
+# MAGIC
+# MAGIC 2. **get_stock_info_structured(symbol)** - Get key stock information as a table
+# MAGIC    * `symbol` (STRING) - Stock ticker symbol
+# MAGIC    * Returns: One row of typed columns (company_name, sector, industry, market_cap, current_price, pe_ratio, dividend_yield, high_52w, low_52w); no rows when no data is found
 # MAGIC
-# MAGIC 2. **get_stock_history(symbol, period, interval_val)** - Get historical OHLCV data
+# MAGIC 3. **get_stock_history(symbol, period, interval_val)** - Get historical OHLCV data
 # MAGIC    * `symbol` (STRING) - Stock ticker symbol
 # MAGIC    * `period` (STRING) - Data period (1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, 10y, ytd, max)
 # MAGIC    * `interval_val` (STRING) - Data interval (1m, 2m, 5m, 15m, 30m, 60m, 90m, 1h, 1d, 5d, 1wk, 1mo, 3mo)
-# MAGIC    * Returns: JSON with historical Open, High, Low, Close, Volume data
+# MAGIC    * Returns: JSON with historical Open, High, Low, Close, Volume data, as the `columns` names and a `data` object holding one array per column
+# MAGIC
+# MAGIC 4. **get_stock_history_batch(symbol, period, interval_val)** - Get historical OHLCV data for many symbols
+# MAGIC    * Same parameters and JSON response as `get_stock_history`, without the Dividends and Stock Splits columns
+# MAGIC    * Rows in a batch that share a period and interval are fetched with a single multi-symbol `yf.download`, so prefer this for bulk queries over a table of symbols; keep `get_stock_history` for ad-hoc lookups
+# MAGIC
+# MAGIC 5. **get_stock_prices(symbol, period, interval_val)** - Get historical OHLCV data as typed values
+# MAGIC    * Same parameters as `get_stock_history`
+# MAGIC    * Returns: `ARRAY<STRUCT<date, open, high, low, close, volume>>`, usable without `from_json`; NULL when no data is found
 # MAGIC
-# MAGIC 3. **get_financials(symbol, statement_type)** - Get financial statements
+# MAGIC 6. **get_financials(symbol, statement_type)** - Get financial statements
 # MAGIC    * `symbol` (STRING) - Stock ticker symbol
 # MAGIC    * `statement_type` (STRING) - Statement type: 'income', 'balance', or 'cashflow'
 # MAGIC    * Returns: JSON with financial statement data
 # MAGIC
-# MAGIC 4. **get_recommendations(symbol)** - Get analyst recommendations
+# MAGIC 7. **get_recommendations(symbol)** - Get analyst recommendations
 # MAGIC    * `symbol` (STRING) - Stock ticker symbol
-# MAGIC    * Returns: JSON with analyst ratings and recommendations
+# MAGIC    * Returns: JSON with analyst ratings and recommendations, as the `columns` names and a `recommendations` object holding one array per column
 # MAGIC
-# MAGIC 5. **get_dividends(symbol)** - Get dividend history
+# MAGIC 8. **get_dividends(symbol)** - Get dividend history
 # MAGIC    * `symbol` (STRING) - Stock ticker symbol
 # MAGIC    * Returns: JSON with dividend payment history
 # MAGIC
@@ -376,6 +811,12 @@ display(result_df)
 # MAGIC -- Get last 5 days of stock history
 # MAGIC SELECT get_stock_history('MSFT', '5d', '1d');
 # MAGIC
+# MAGIC -- Get a month of history for every symbol in a table
+# MAGIC SELECT symbol, get_stock_history_batch(symbol, '1mo', '1d') FROM portfolio;
+# MAGIC
+# MAGIC -- Get typed daily closes without parsing JSON
+# MAGIC SELECT price.date, price.close FROM (SELECT explode(get_stock_prices('MSFT', '1mo', '1d')) AS price);
+# MAGIC
 # MAGIC -- Get income statement
 # MAGIC SELECT get_financials('GOOGL', 'income');
 # MAGIC
@@ -391,23 +832,16 @@ display(result_df)
 # MAGIC -- Get dividend history
 # MAGIC SELECT get_dividends('JNJ');
 # MAGIC
-# MAGIC -- Parse JSON into structured data
-# MAGIC SELECT
-# MAGIC   json_data.shortName AS company_name,
-# MAGIC   json_data.marketCap AS market_cap,
-# MAGIC   json_data.currentPrice AS price
-# MAGIC FROM (
-# MAGIC   SELECT from_json(
-# MAGIC     get_stock_info('AAPL'),
-# MAGIC     'STRUCT<shortName:STRING, marketCap:BIGINT, currentPrice:DOUBLE>'
-# MAGIC   ) AS json_data
-# MAGIC );
+# MAGIC -- Get structured stock info for every symbol in a table
+# MAGIC SELECT p.symbol, s.company_name, s.market_cap, s.current_price
+# MAGIC FROM portfolio p, LATERAL get_stock_info_structured(p.symbol) s;
 # MAGIC ```
 # MAGIC
 # MAGIC ### Notes
 # MAGIC
 # MAGIC * **No API Key Required**: The `yfinance` library scrapes publicly available Yahoo Finance data
 # MAGIC * **Rate Limits**: Yahoo Finance may rate-limit requests; use responsibly
+# MAGIC * **Caching**: Each Python worker reuses Ticker objects, and `get_stock_info` results, for up to a minute per symbol
 # MAGIC * **Data Accuracy**: Data is sourced from Yahoo Finance and may have slight delays
 # MAGIC * **Market Hours**: Real-time prices are only available during market hours
 # MAGIC